@@ -4,12 +4,13 @@
 """
 import logging
 import time
-import traceback
 from contextlib import asynccontextmanager
+from typing import Literal
 
-from fastapi import FastAPI, File, UploadFile, Form, Request
+import PIL
+from fastapi import FastAPI, File, UploadFile, Form, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from fastapi.exceptions import HTTPException as FastAPIHTTPException
 
 from config import settings
@@ -31,6 +32,11 @@ startup_time = time.time()
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     logger.info(f"Запуск приложения {settings.app_name} v{settings.app_version}")
+    # Pillow-SIMD помечает версию суффиксом .postN
+    if ".post" in PIL.__version__:
+        logger.info(f"Используется Pillow-SIMD {PIL.__version__}")
+    else:
+        logger.warning(f"Используется стандартный Pillow {PIL.__version__}, Pillow-SIMD не установлен")
     yield
     logger.info("Завершение работы приложения")
 
@@ -39,7 +45,9 @@ app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     debug=settings.debug,
-    lifespan=lifespan
+    lifespan=lifespan,
+    # orjson заметно быстрее stdlib json на больших base64-строках
+    default_response_class=ORJSONResponse
 )
 
 
@@ -55,12 +63,13 @@ async def error_handling_middleware(request: Request, call_next):
         raise http_exc
     except Exception as e:
         logger.error(f"Необработанное исключение: {str(e)}")
-        logger.error(f"Трейсбек: {traceback.format_exc()}")
+        # Трейсбек форматируется только при включенном DEBUG
+        logger.debug("Трейсбек необработанного исключения", exc_info=True)
 
         # Очищаем ошибку от непечатаемых символов
         safe_error = str(e).encode('utf-8', 'ignore').decode('utf-8')
 
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "success": False,
@@ -82,16 +91,25 @@ app.add_middleware(
 
 @app.post("/convert", response_model=ConvertResponse)
 async def convert_image(
+        request: Request,
         file: UploadFile = File(...),
         threshold: int = Form(settings.default_threshold, ge=0, le=255,
-                             description="Порог бинаризации (0-255)")
+                             description="Порог бинаризации (0-255)"),
+        pages: str = Form("all", description="Страницы PDF: all, N или N-M")
 ):
     """
     Конвертирует изображения и PDF в бинарный формат с заданным порогом.
+
+    При заголовке `Accept: multipart/mixed` страницы возвращаются сырыми PNG
+    в multipart-ответе, без base64.
     """
     logger.info(f"Получен запрос на конвертацию файла: {file.filename}")
-    result = await convert_image_endpoint(file, threshold)
-    logger.info(f"Конвертация завершена, обработано {result.get('count', 0)} изображений")
+    multipart = "multipart/mixed" in request.headers.get("accept", "")
+    result = await convert_image_endpoint(file, threshold, pages, multipart)
+    if multipart:
+        logger.info(f"Конвертация завершена, обработано {result.headers.get('X-Image-Count', 0)} изображений")
+    else:
+        logger.info(f"Конвертация завершена, обработано {result.get('count', 0)} изображений")
     return result
 
 
@@ -101,17 +119,32 @@ async def rotate_image(
         min_line_length: int = Form(settings.default_min_line_length, ge=10, le=500,
                                    description="Минимальная длина линии"),
         max_line_gap: int = Form(settings.default_max_line_gap, ge=1, le=100,
-                                description="Максимальный разрыв в линии"),
-        use_morphology: bool = Form(False, description="Применять морфологические операции")
+                                description="Максимальный разрыв в линии (только преобразование Хафа)"),
+        use_morphology: bool = Form(False, description="Закрывать разрывы на карте границ (только преобразование Хафа)"),
+        output_format: Literal["png", "jpeg"] = Form("png", description="Формат результата: png или jpeg (с потерями, быстрее)"),
+        interpolation: Literal["auto", "linear", "nearest"] = Form(
+            "auto", description="Интерполяция при повороте: auto (nearest для бинарных), linear или nearest"),
+        encode: Literal["base64", "raw"] = Query("base64", description="base64 в JSON или сырые байты изображения")
 ):
     """
     Находит самую длинную горизонтальную линию, определяет угол и поворачивает изображение.
+
+    При `?encode=raw` изображение отдаётся сырыми байтами, а угол поворота
+    и найденная линия — в заголовках `X-Rotation-Angle` и `X-Line-Info`.
+
+    С opencv-contrib линии ищет детектор FLD: `max_line_gap` и `use_morphology`
+    применяются только в пути Хафа, а `debug_info.edge_pixel_count` для FLD равен null.
     """
     logger.info(f"Получен запрос на поворот файла: {file.filename}")
+    raw = encode == "raw"
     result = await rotate_image_endpoint(
-        file, min_line_length, max_line_gap, use_morphology
+        file, min_line_length, max_line_gap, use_morphology,
+        output_format=output_format, raw=raw, interpolation=interpolation
     )
-    logger.info(f"Поворот завершен, угол: {result.get('rotation_angle', 0):.2f}°")
+    if isinstance(result, Response):
+        logger.info(f"Поворот завершен, угол: {float(result.headers['X-Rotation-Angle']):.2f}°")
+    else:
+        logger.info(f"Поворот завершен, угол: {result.get('rotation_angle', 0):.2f}°")
     return result
 
 
@@ -158,5 +191,7 @@ if __name__ == "__main__":
         port=settings.port,  # ← Теперь будет использовать PORT из env
         reload=settings.debug,
         workers=settings.workers,
+        loop=settings.loop,
+        http=settings.http,
         log_level=settings.log_level.lower()
     )
\ No newline at end of file
@@ -18,7 +18,12 @@ class Settings(BaseSettings):
 
     host: str = Field(default="0.0.0.0")
     port: int = Field(default=8000)
-    workers: int = Field(default=1)
+    # Параллелизм по процессам: один воркер на ядро, внутри воркера небольшой пул потоков
+    workers: int = Field(default_factory=lambda: os.cpu_count() or 1, ge=1)
+    worker_threads: int = Field(default=2, ge=1, le=8)
+    # "auto" берёт uvloop/httptools, если они установлены, иначе asyncio/h11
+    loop: str = Field(default="auto")
+    http: str = Field(default="auto")
 
     log_level: str = Field(default="INFO")
     log_file: Optional[str] = Field(default=None)
@@ -35,6 +40,10 @@ class Settings(BaseSettings):
     default_min_line_length: int = Field(default=50, ge=10, le=500)
     default_max_line_gap: int = Field(default=20, ge=1, le=100)
 
+    pdf_dpi: int = Field(default=150, ge=50, le=600)
+    # Общий бюджет кэша PDF на все воркеры; каждому воркеру достаётся pdf_cache_max_bytes // workers
+    pdf_cache_max_bytes: int = Field(default=256 * 1024 * 1024, ge=0)
+
     upload_dir: Path = Path("uploads")
     temp_dir: Path = Path("temp")
 
@@ -3,104 +3,211 @@
 Эндпоинт для конвертации изображений
 """
 from fastapi import UploadFile, HTTPException
-from typing import Dict, List, Union
-import io
+from fastapi.responses import StreamingResponse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Union
+import asyncio
+import uuid
 from PIL import Image
-from utils import binary_convert, convert_pdf_to_images, get_logger  # Используем импорт через __init__.py
-import base64
-import traceback
+import numpy as np
+from config import settings
+from utils import binary_convert, iter_pdf_pages, parse_page_range, check_upload_size, PDFRenderCache, get_logger  # Используем импорт через __init__.py
+try:
+    # SIMD-реализация base64 (SSSE3/AVX2), совместима по API со стандартной
+    import pybase64 as base64
+except ImportError:
+    import base64
 
 logger = get_logger(__name__)
 
+# Поддерживаемые типы файлов (берутся из настроек один раз при импорте)
+_SUPPORTED_DOCUMENT_TYPES = frozenset({"application/pdf"})
+_SUPPORTED_IMAGE_TYPES = frozenset(settings.allowed_content_types) - _SUPPORTED_DOCUMENT_TYPES
+_SUPPORTED_IMAGE_EXTENSIONS = frozenset(settings.allowed_extensions) - {"pdf"}
 
-async def convert_image_endpoint(file: UploadFile, threshold: int = 128) -> Dict[str, Union[List[str], str]]:
+# Общий пул потоков для постраничной бинаризации
+# (ядра уже заняты воркерами, поэтому потоков на воркер немного)
+_page_executor = ThreadPoolExecutor(max_workers=settings.worker_threads, thread_name_prefix="convert")
+# Растеризация PDF: генератор iter_pdf_pages шагает в отдельном потоке, а не в event loop.
+# Один поток — документ PyMuPDF (не потокобезопасный) используется только из него
+_render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-render")
+# Сколько страниц одновременно держим в памяти на один запрос
+_MAX_PAGES_IN_FLIGHT = settings.worker_threads
+# Кэш готовых результатов для повторно присылаемых PDF (доля общего бюджета на этот воркер)
+_pdf_cache = PDFRenderCache(settings.pdf_cache_max_bytes // settings.workers)
+
+
+def _process_page(img: Union[Image.Image, np.ndarray], threshold: int, index: int) -> bytes:
+    """
+    Бинаризует одну страницу
+
+    Args:
+        img: Изображение PIL или страница в оттенках серого (numpy uint8, 2D)
+        threshold: Порог бинаризации
+        index: Номер страницы (с нуля)
+
+    Returns:
+        Байты бинарного PNG
+    """
+    logger.debug("Обработка изображения %d", index + 1)
+    if isinstance(img, Image.Image):
+        # Убедимся, что изображение в оттенках серого
+        if img.mode != 'L':
+            logger.debug("Конвертация изображения из режима %s в L", img.mode)
+            img = img.convert('L')
+        img = np.asarray(img)
+
+    # Применяем бинаризацию напрямую к пикселям, без промежуточного PNG
+    binary_bytes = binary_convert(img, threshold)
+    logger.debug("Изображение %d бинаризовано, размер PNG: %d байт", index + 1, len(binary_bytes))
+    return binary_bytes
+
+
+async def _process_pages(images: Iterable[Union[Image.Image, np.ndarray]], threshold: int) -> List[bytes]:
+    """
+    Бинаризует страницы по мере их поступления из итератора
+
+    Страницы отправляются в пул потоков скользящим окном, поэтому в памяти
+    одновременно находится не более _MAX_PAGES_IN_FLIGHT изображений.
+    Следующая страница запрашивается у итератора в потоке _render_executor:
+    растеризация PDF не блокирует event loop.
+
+    Args:
+        images: Итерируемый источник изображений PIL или массивов numpy
+        threshold: Порог бинаризации
+
+    Returns:
+        Список бинарных PNG в порядке страниц
+    """
+    loop = asyncio.get_running_loop()
+    pages = iter(images)
+    pending = deque()
+    binary_images = []
+    try:
+        index = 0
+        while (img := await loop.run_in_executor(_render_executor, next, pages, None)) is not None:
+            pending.append(loop.run_in_executor(_page_executor, _process_page, img, threshold, index))
+            index += 1
+            if len(pending) >= _MAX_PAGES_IN_FLIGHT:
+                binary_images.append(await pending.popleft())
+        binary_images.extend(await asyncio.gather(*pending))
+    finally:
+        # Незавершённый генератор закрывает документ в том же потоке, где его открыл
+        close = getattr(pages, "close", None)
+        if close is not None:
+            await loop.run_in_executor(_render_executor, close)
+    return binary_images
+
+
+def _build_response(binary_images: List[bytes], multipart: bool) -> Union[Dict, StreamingResponse]:
+    """
+    Формирует ответ эндпоинта /convert
+
+    Args:
+        binary_images: Бинарные PNG в порядке страниц
+        multipart: Отдать сырые PNG в multipart/mixed вместо JSON с base64
+
+    Returns:
+        Словарь для JSON-ответа или потоковый multipart-ответ
+    """
+    if not multipart:
+        base64_list = [base64.b64encode(png).decode('ascii') for png in binary_images]
+        return {"images_base64": base64_list, "count": len(base64_list), "success": True}
+
+    boundary = uuid.uuid4().hex
+
+    def iter_parts():
+        for png in binary_images:
+            yield (f"--{boundary}\r\nContent-Type: image/png\r\n"
+                   f"Content-Length: {len(png)}\r\n\r\n").encode("ascii")
+            yield png
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode("ascii")
+
+    return StreamingResponse(
+        iter_parts(),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers={"X-Image-Count": str(len(binary_images))}
+    )
+
+
+async def convert_image_endpoint(file: UploadFile, threshold: int = 128, pages: str = "all",
+                                 multipart: bool = False) -> Union[Dict[str, Union[List[str], str]], StreamingResponse]:
     """
     Обработчик эндпоинта /convert
 
     Args:
         file: Загруженный файл
         threshold: Порог бинаризации
+        pages: Диапазон страниц PDF: "all", "N" или "N-M"
+        multipart: Вернуть сырые PNG в multipart/mixed вместо base64 в JSON
 
     Returns:
-        Словарь с результатами
+        Словарь с результатами или multipart-ответ
     """
     try:
-        # Читаем содержимое файла
-        contents = await file.read()
-        logger.info(f"Получен файл: {file.filename}, размер: {len(contents)} байт, content_type: {file.content_type}")
-
-        # Расширенный список поддерживаемых типов файлов
-        SUPPORTED_IMAGE_TYPES = [
-            "image/jpeg", "image/jpg", "image/png", "image/bmp", "image/gif",
-            "image/x-png", "image/pjpeg", "image/x-jpg", "image/webp"
-        ]
-        SUPPORTED_DOCUMENT_TYPES = ["application/pdf"]
+        # Проверяем размер, не читая файл целиком в память
+        size = await check_upload_size(file, settings.max_file_size)
+        logger.info("Получен файл: %s, размер: %d байт, content_type: %s", file.filename, size, file.content_type)
 
         # Проверяем тип файла более гибко
         is_supported = False
         file_ext = file.filename.lower().split('.')[-1] if '.' in file.filename else ""
 
-        if file.content_type in SUPPORTED_IMAGE_TYPES or file_ext in ["jpg", "jpeg", "png", "bmp", "gif", "webp"]:
+        if file.content_type in _SUPPORTED_IMAGE_TYPES or file_ext in _SUPPORTED_IMAGE_EXTENSIONS:
             is_supported = True
-            logger.info(f"Поддерживаемый тип изображения: {file.content_type}, расширение: {file_ext}")
-        elif file.content_type in SUPPORTED_DOCUMENT_TYPES or file_ext == "pdf":
+            logger.info("Поддерживаемый тип изображения: %s, расширение: %s", file.content_type, file_ext)
+        elif file.content_type in _SUPPORTED_DOCUMENT_TYPES or file_ext == "pdf":
             is_supported = True
-            logger.info(f"Поддерживаемый тип документа: {file.content_type}, расширение: {file_ext}")
+            logger.info("Поддерживаемый тип документа: %s, расширение: %s", file.content_type, file_ext)
         else:
-            logger.warning(f"Неподдерживаемый тип файла: content_type={file.content_type}, расширение={file_ext}")
+            logger.warning("Неподдерживаемый тип файла: content_type=%s, расширение=%s", file.content_type, file_ext)
             raise HTTPException(status_code=400,
                                 detail=f"Неподдерживаемый тип файла. Поддерживаются: JPG, PNG, BMP, GIF, PDF. Получен: {file.content_type} ({file_ext})")
 
         # Обработка в зависимости от типа файла
+        cache_key = None
         if file.content_type == "application/pdf" or file_ext == "pdf":
-            logger.info("Конвертация PDF файла")
-            # Конвертируем PDF в изображения
-            images = convert_pdf_to_images(contents)
-            logger.info(f"PDF сконвертирован в {len(images)} изображений")
+            logger.info("Конвертация PDF файла, страницы: %s", pages)
+            first_page, last_page = parse_page_range(pages)
+            contents = await file.read()
+
+            # Повторно присланный PDF отдаем из кэша без растеризации
+            cache_key = PDFRenderCache.make_key(contents, settings.pdf_dpi, threshold, first_page, last_page)
+            cached = _pdf_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Результат для PDF взят из кэша, страниц: %d", len(cached))
+                return _build_response(cached, multipart)
+
+            # Страницы растеризуются лениво, по мере обработки
+            images = iter_pdf_pages(contents, dpi=settings.pdf_dpi,
+                                    first_page=first_page, last_page=last_page)
         else:
             logger.info("Обработка изображения")
-            # Открываем как изображение
-            img = Image.open(io.BytesIO(contents))
+            # Открываем как изображение прямо из временного файла загрузки
+            img = Image.open(file.file)
             images = [img]
-            logger.info(f"Загружено изображение: {img.format}, размер: {img.size}, mode: {img.mode}")
-
-        # Конвертируем каждое изображение в бинарный формат
-        binary_images = []
-        for i, img in enumerate(images):
-            logger.debug(f"Обработка изображения {i + 1}/{len(images)}")
-            # Конвертируем в байты для обработки
-            img_buffer = io.BytesIO()
-            # Убедимся, что изображение в правильном формате
-            if img.mode not in ('RGB', 'L'):
-                logger.debug(f"Конвертация изображения из режима {img.mode} в RGB")
-                img = img.convert('RGB')
-            img.save(img_buffer, format="PNG")
-            img_bytes = img_buffer.getvalue()
-
-            # Применяем бинаризацию
-            binary_bytes = binary_convert(img_bytes, threshold)
-            binary_images.append(binary_bytes)
-            logger.debug(f"Изображение {i + 1} успешно бинаризовано")
-
-        # Конвертируем в base64
-        base64_list = []
-        for i, binary_bytes in enumerate(binary_images):
-            base64_str = base64.b64encode(binary_bytes).decode('utf-8')
-            base64_list.append(base64_str)
-            logger.debug(f"Изображение {i + 1} сконвертировано в base64, длина: {len(base64_str)}")
+            logger.info("Загружено изображение: %s, размер: %s, mode: %s", img.format, img.size, img.mode)
 
-        return {"images_base64": base64_list, "count": len(base64_list), "success": True}
+        # Конвертируем изображения в бинарный формат параллельно:
+        # OpenCV и NumPy отпускают GIL на время обработки
+        binary_images = await _process_pages(images, threshold)
+        if cache_key is not None:
+            _pdf_cache.set(cache_key, binary_images)
+
+        return _build_response(binary_images, multipart)
 
     except HTTPException:
         # Перехватываем HTTP исключения и пропускаем их дальше
         raise
     except ValueError as e:
         safe_error = str(e).encode('utf-8', 'ignore').decode('utf-8')
-        logger.error(f"Ошибка валидации: {safe_error}")
-        logger.error(f"Трейсбек: {traceback.format_exc()}")
+        logger.error("Ошибка валидации: %s", safe_error)
+        logger.debug("Трейсбек ошибки", exc_info=True)
         raise HTTPException(status_code=400, detail=safe_error)
     except Exception as e:
-        logger.error(f"Критическая ошибка обработки: {str(e)}")
-        logger.error(f"Трейсбек: {traceback.format_exc()}")
+        logger.error("Критическая ошибка обработки: %s", e)
+        logger.debug("Трейсбек ошибки", exc_info=True)
         safe_error = str(e).encode('utf-8', 'ignore').decode('utf-8')
         raise HTTPException(status_code=500, detail=f"Внутренняя ошибка сервера: {safe_error}")
\ No newline at end of file
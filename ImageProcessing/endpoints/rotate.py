@@ -2,273 +2,580 @@
 """
 Эндпоинт для поворота изображений
 """
-from fastapi import UploadFile, HTTPException
-from typing import Dict, Union, Optional
-import base64
+from fastapi import UploadFile, HTTPException, Response
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Union, Optional, Tuple
+import asyncio
+import io
+import json
+import logging
 import cv2
 import numpy as np
-from utils import get_logger
+from PIL import Image
+from config import settings
+from utils import check_upload_size, get_logger
 import traceback
+try:
+    # SIMD-реализация base64 (SSSE3/AVX2), совместима по API со стандартной
+    import pybase64 as base64
+except ImportError:
+    import base64
 
 logger = get_logger(__name__)
 
+# Быстрый детектор линий (FLD) доступен только в сборке opencv-contrib
+_HAS_FAST_LINE_DETECTOR = hasattr(cv2, "ximgproc")
 
-async def rotate_image_endpoint(
-        file: UploadFile,
-        min_line_length: int = 50,
-        max_line_gap: int = 20,
-        use_morphology: bool = False,
-        debug_mode: bool = False
-) -> Dict[str, Union[str, float, dict, bool, Optional[str]]]:
+
+def _cuda_available() -> bool:
+    """Проверяет, собран ли OpenCV с CUDA и есть ли доступное устройство"""
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+
+# Canny, Хаф и поворот на GPU, если OpenCV собран с CUDA
+_HAS_CUDA = _cuda_available()
+
+# Ограниченный пул для CPU-части поворота, чтобы не блокировать event loop
+_rotate_executor = ThreadPoolExecutor(max_workers=settings.worker_threads, thread_name_prefix="rotate")
+
+# Максимальная сторона изображения, на котором ищутся линии.
+# Угол наклона от масштаба не зависит, а поворот применяется к оригиналу
+_DETECTION_MAX_SIDE = 1024
+
+# Флаги декодирования JPEG сразу в уменьшенном виде (масштабирование в DCT)
+_REDUCED_GRAYSCALE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+}
+
+# Параметры кодирования результата: PNG с быстрым сжатием или JPEG (с потерями)
+_ENCODE_PARAMS = {
+    "png": (".png", [cv2.IMWRITE_PNG_COMPRESSION, 1]),
+    "jpeg": (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 90]),
+}
+_MEDIA_TYPES = {"png": "image/png", "jpeg": "image/jpeg"}
+
+# Форматы PIL, соответствующие форматам вывода
+_PIL_FORMATS = {"png": "PNG", "jpeg": "JPEG"}
+
+# Максимальная сторона выборки пикселей для проверки бинарности изображения
+_BINARY_CHECK_MAX_SIDE = 512
+
+# Углы поворота меньше этого (в градусах) считаются нулевыми
+_MIN_ROTATION_ANGLE = 0.05
+
+# Ядро закрытия карты границ Canny. Только закрытие: открытие стирает
+# однопиксельные границы одиночных линий, а короткий шум отсекает minLineLength
+_EDGE_CLOSE_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+# Интерполяция при повороте. Для бинарных документов ближайший сосед даёт
+# визуально тот же результат, читает один пиксель вместо четырёх и не
+# добавляет серых полутонов на границах
+_INTERPOLATION_FLAGS = {"linear": cv2.INTER_LINEAR, "nearest": cv2.INTER_NEAREST}
+
+# Повороты на прямой угол выполняются перестановкой пикселей без интерполяции.
+# Положительный угол - против часовой стрелки, как в getRotationMatrix2D
+_RIGHT_ANGLE_ROTATIONS = {
+    90: cv2.ROTATE_90_COUNTERCLOCKWISE,
+    -90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    -180: cv2.ROTATE_180,
+}
+
+# Разделитель блоков в отладочном логе
+_DEBUG_SEPARATOR = "=" * 50
+
+
+def _read_header(contents: bytes) -> Tuple[Optional[str], Optional[Tuple[int, int]], Optional[str]]:
     """
-    Обработчик эндпоинта /rotate с безопасной инициализацией переменных
+    Читает формат, размер и режим изображения из заголовка, не декодируя пиксели
+
+    Args:
+        contents: Байты загруженного изображения
+
+    Returns:
+        Кортеж (формат PIL, (ширина, высота), режим PIL) или (None, None, None),
+        если формат не распознан
     """
     try:
-        # Читаем содержимое файла
-        contents = await file.read()
+        with Image.open(io.BytesIO(contents)) as header:
+            return header.format, header.size, header.mode
+    except Exception:
+        return None, None, None
 
-        # Проверяем, что файл не пустой
-        if len(contents) == 0:
-            raise ValueError("Пустой файл")
 
-        # Конвертируем байты в изображение OpenCV
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+def _reduced_decode_factor(image_format: Optional[str], image_size: Optional[Tuple[int, int]]) -> int:
+    """
+    Подбирает коэффициент уменьшения при декодировании для поиска линий
+
+    Уменьшенное декодирование дешевле полного только для JPEG, поэтому для
+    остальных форматов возвращается 1. Коэффициент выбирается так, чтобы
+    изображение оставалось не меньше _DETECTION_MAX_SIDE.
+
+    Args:
+        image_format: Формат изображения по данным PIL
+        image_size: Размер изображения (ширина, высота)
+
+    Returns:
+        Коэффициент уменьшения: 1, 2, 4 или 8
+    """
+    if image_format != "JPEG" or image_size is None:
+        return 1
+
+    max_side = max(image_size)
+    for factor in _REDUCED_GRAYSCALE_FLAGS:
+        if max_side // factor >= _DETECTION_MAX_SIDE:
+            return factor
+    return 1
+
 
+def _decode_full(nparr: np.ndarray) -> np.ndarray:
+    """
+    Декодирует изображение в полном разрешении
+
+    Args:
+        nparr: Байты изображения в виде массива uint8
+
+    Returns:
+        Изображение BGR или в оттенках серого
+    """
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if img is None:
+        img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
         if img is None:
-            img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-            if img is None:
-                raise ValueError("Не удалось загрузить изображение. Проверьте формат файла.")
+            raise ValueError("Не удалось загрузить изображение. Проверьте формат файла.")
+    return img
 
-        logger.debug("=" * 50)
-        logger.debug(f"DEBUG: Начало обработки файла: {file.filename}")
-        logger.debug(f"DEBUG: Размер изображения: {img.shape}")
-        logger.debug(f"DEBUG: Тип изображения: {img.dtype}")
-        logger.debug(
-            f"DEBUG: Настройки: min_line_length={min_line_length}, max_line_gap={max_line_gap}, use_morphology={use_morphology}")
-        logger.debug("=" * 50)
 
-        # ИНИЦИАЛИЗИРУЕМ ПЕРЕМЕННЫЕ ЗАРАНЕЕ для избежания ошибок
-        horizontal_lines = []
-        all_lines_debug = []
-        rotation_angle = 0.0
-        line_info = None
+def _is_binary(img: np.ndarray) -> bool:
+    """
+    Проверяет по данным, что изображение чёрно-белое (только 0 и 255, каналы совпадают).
 
-        # Сохраняем оригинальное изображение для поворота
-        original_img = img.copy()
+    IMREAD_COLOR декодирует бинарные PNG/TIFF в три канала, поэтому размерность
+    массива бинарность не выдаёт. Проверяется прореженная (без интерполяции) копия.
 
-        # Применяем морфологию если нужно
-        if use_morphology:
-            logger.debug("DEBUG: Применение морфологических операций")
-            if len(img.shape) == 3:  # Если цветное
-                gray_for_morph = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            else:
-                gray_for_morph = img.copy()
+    Args:
+        img: Изображение BGR или в оттенках серого
 
-            kernel = np.ones((3, 3), np.uint8)
-            closed = cv2.morphologyEx(gray_for_morph, cv2.MORPH_CLOSE, kernel)
-            cleaned = cv2.morphologyEx(closed, cv2.MORPH_OPEN, kernel)
+    Returns:
+        True, если все пиксели выборки чисто чёрные или белые
+    """
+    step = max(1, -(-max(img.shape[:2]) // _BINARY_CHECK_MAX_SIDE))
+    sample = img[::step, ::step]
+    if sample.ndim == 3:
+        if not (np.array_equal(sample[..., 0], sample[..., 1]) and np.array_equal(sample[..., 0], sample[..., 2])):
+            return False
+        sample = sample[..., 0]
+    return set(np.unique(sample).tolist()) <= {0, 255}
 
-            if len(img.shape) == 3:
-                img = cleaned
-            else:
-                img = cleaned
 
-        # Конвертируем в оттенки серого если цветное
-        if len(img.shape) == 3:
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            logger.debug("DEBUG: Конвертировано в grayscale")
-        else:
-            gray = img.copy()
+def _detect_lines_cuda(gray: np.ndarray, min_line_length: int, max_line_gap: int,
+                       threshold: int, use_morphology: bool = False) -> Tuple[Optional[np.ndarray], int]:
+    """
+    Ищет отрезки на GPU: Canny и вероятностное преобразование Хафа
+
+    Args:
+        gray: Изображение в оттенках серого
+        min_line_length: Минимальная длина линии
+        max_line_gap: Максимальный разрыв в линии
+        threshold: Порог голосов преобразования Хафа
+        use_morphology: Закрыть разрывы на карте границ перед Хафом
 
-        # Применяем размытие
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        logger.debug(f"DEBUG: Применено размытие")
+    Returns:
+        Кортеж (линии в формате cv2.HoughLinesP или None, число пикселей границ)
+    """
+    gpu_gray = cv2.cuda_GpuMat()
+    gpu_gray.upload(gray)
+
+    gpu_edges = cv2.cuda.createCannyEdgeDetector(50, 150, 3).detect(gpu_gray)
+    if use_morphology:
+        closing = cv2.cuda.createMorphologyFilter(cv2.MORPH_CLOSE, cv2.CV_8UC1, _EDGE_CLOSE_KERNEL)
+        gpu_edges = closing.apply(gpu_edges)
+    edge_count = cv2.cuda.countNonZero(gpu_edges)
+
+    hough = cv2.cuda.createHoughSegmentDetector(1, np.pi / 180, min_line_length, max_line_gap,
+                                                4096, threshold)
+    segments = hough.detect(gpu_edges)
+    if segments.empty():
+        return None, edge_count
+    # GPU возвращает строку 1xN, приводим к форме Nx1x4 как у HoughLinesP
+    return segments.download().reshape(-1, 1, 4), edge_count
+
+
+def _rotate_sync(
+        contents: bytes,
+        filename: Optional[str],
+        min_line_length: int,
+        max_line_gap: int,
+        use_morphology: bool,
+        output_format: str,
+        raw: bool,
+        interpolation: str
+) -> Union[Dict[str, Union[str, float, dict, bool, Optional[str]]], Response]:
+    """
+    Синхронная часть обработки /rotate: декодирование, поиск линий, поворот и кодирование
+
+    Args:
+        contents: Байты загруженного изображения
+        filename: Имя файла для логов
+        min_line_length: Минимальная длина линии
+        max_line_gap: Максимальный разрыв в линии (только для преобразования Хафа)
+        use_morphology: Закрыть разрывы на карте границ (только для преобразования Хафа)
+        output_format: Формат результата: "png" или "jpeg"
+        raw: Вернуть сырые байты изображения вместо JSON с base64
+        interpolation: Интерполяция при повороте: "auto", "linear" или "nearest";
+            "auto" выбирает ближайшего соседа для бинарных и одноканальных изображений
+
+    Returns:
+        Словарь для JSON-ответа или Response с изображением
+    """
+    # frombuffer не копирует байты
+    nparr = np.frombuffer(contents, np.uint8)
+
+    # Проверяем, что файл не пустой
+    if nparr.size == 0:
+        raise ValueError("Пустой файл")
 
-        # Детектируем границы
-        edges = cv2.Canny(blurred, 50, 150, apertureSize=3)
+    # Большой JPEG для поиска линий декодируем сразу уменьшенным,
+    # полное разрешение понадобится только для поворота
+    image_format, image_size, image_mode = _read_header(contents)
+
+    # Дальше байты доступны только через nparr, лишних ссылок на буфер не держим
+    del contents
+
+    reduce_factor = _reduced_decode_factor(image_format, image_size)
+    if reduce_factor > 1:
+        img = cv2.imdecode(nparr, _REDUCED_GRAYSCALE_FLAGS[reduce_factor])
+        if img is None:
+            raise ValueError("Не удалось загрузить изображение. Проверьте формат файла.")
+        original_img = None
+        # Полное декодирование всегда даёт 3 канала BGR
+        image_shape = [image_size[1], image_size[0], 3]
+    else:
+        img = _decode_full(nparr)
+        image_shape = list(img.shape)
+
+    # Уровень логирования проверяем один раз: при INFO отладочные
+    # строки и словари не формируются вовсе
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+
+    if debug_enabled:
+        logger.debug(_DEBUG_SEPARATOR)
+        logger.debug(f"DEBUG: Начало обработки файла: {filename}")
+        logger.debug(f"DEBUG: Размер изображения: {img.shape}")
+        logger.debug(f"DEBUG: Тип изображения: {img.dtype}")
+        logger.debug(
+            f"DEBUG: Настройки: min_line_length={min_line_length}, max_line_gap={max_line_gap}, use_morphology={use_morphology}")
+        logger.debug(_DEBUG_SEPARATOR)
+
+    # ИНИЦИАЛИЗИРУЕМ ПЕРЕМЕННЫЕ ЗАРАНЕЕ для избежания ошибок
+    horizontal_count = 0
+    all_lines_debug = []
+    rotation_angle = 0.0
+    line_info = None
+
+    # Сохраняем оригинальное изображение для поворота. Копия не нужна:
+    # все операции ниже создают новые буферы и img не изменяют
+    if reduce_factor == 1:
+        original_img = img
+
+    # Конвертируем в оттенки серого если цветное
+    if len(img.shape) == 3:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if debug_enabled:
+            logger.debug("DEBUG: Конвертировано в grayscale")
+    else:
+        gray = img
+
+    # Для поиска линий уменьшаем большие изображения, пороги масштабируем
+    # так, чтобы они соответствовали исходному разрешению
+    resize_scale = min(1.0, _DETECTION_MAX_SIDE / max(gray.shape[:2]))
+    if resize_scale < 1.0:
+        gray = cv2.resize(gray, None, fx=resize_scale, fy=resize_scale, interpolation=cv2.INTER_AREA)
+    # Итоговый масштаб относительно оригинала с учётом уменьшенного декодирования
+    scale = resize_scale / reduce_factor
+    if debug_enabled and scale < 1.0:
+        logger.debug(f"DEBUG: Изображение уменьшено для поиска линий: scale={scale:.3f}, shape={gray.shape}")
+    scaled_min_length = max(1, int(round(min_line_length * scale)))
+    scaled_max_gap = max(1, int(round(max_line_gap * scale)))
+    scaled_threshold = max(1, int(round(50 * scale)))
+
+    if _HAS_FAST_LINE_DETECTOR:
+        # FLD считает градиент сам, размытие и отдельный Canny не нужны. Карты границ нет,
+        # поэтому число пикселей границ не определено, а max_line_gap и use_morphology не применяются
+        fld = cv2.ximgproc.createFastLineDetector(length_threshold=scaled_min_length)
+        lines = fld.detect(gray)
+        edge_count = None
+        if debug_enabled:
+            logger.debug("DEBUG: Линии найдены детектором FLD (max_line_gap и use_morphology не применяются)")
+    elif _HAS_CUDA:
+        lines, edge_count = _detect_lines_cuda(gray, scaled_min_length, scaled_max_gap, scaled_threshold,
+                                               use_morphology)
+        if debug_enabled:
+            logger.debug(f"DEBUG: Линии найдены на GPU, границ: {edge_count} пикселей")
+    else:
+        # Детектируем границы. Отдельное размытие не нужно: Canny сглаживает
+        # оператором Собеля, а для угла наклона мелкий шум не важен
+        edges = cv2.Canny(gray, 50, 150, apertureSize=3, L2gradient=False)
+        if use_morphology:
+            edges = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, _EDGE_CLOSE_KERNEL)
         edge_count = np.sum(edges > 0)
-        logger.debug(f"DEBUG: Детектировано границ: {edge_count} пикселей")
+        if debug_enabled:
+            logger.debug(f"DEBUG: Детектировано границ: {edge_count} пикселей")
 
         # Находим линии с помощью преобразования Хафа
         lines = cv2.HoughLinesP(
             edges,
             rho=1,
             theta=np.pi / 180,
-            threshold=50,
-            minLineLength=min_line_length,
-            maxLineGap=max_line_gap
+            threshold=scaled_threshold,
+            minLineLength=scaled_min_length,
+            maxLineGap=scaled_max_gap
         )
 
-        line_count = len(lines) if lines is not None else 0
-        logger.debug(f"DEBUG: Найдено линий: {line_count}")
-
-        if lines is not None and line_count > 0:
-            for i, line in enumerate(lines):
-                x1, y1, x2, y2 = line[0]
-                # ИСПРАВЛЕНО: правильное вычисление длины линии
-                length = np.sqrt((x2 - x1) ** 2 +  (y2 - y1) **2)
-
-                # Правильное вычисление угла
-                dy = -(y2 - y1)  # Инвертируем ось Y
-                dx = x2 - x1
-                angle = np.degrees(np.arctan2(dy, dx))
+    # Возвращаем координаты линий к исходному разрешению
+    if lines is not None and scale < 1.0:
+        lines = lines / scale
 
-                # Нормализуем угол
-                if angle < -90:
-                    angle += 180
-                elif angle > 90:
-                    angle -= 180
+    line_count = len(lines) if lines is not None else 0
+    if debug_enabled:
+        logger.debug(f"DEBUG: Найдено линий: {line_count}")
 
-                # Отладочная информация
+    if lines is not None and line_count > 0:
+        # Считаем длины и углы всех линий одним векторным проходом
+        segments = lines.reshape(-1, 4)
+        dx = segments[:, 2] - segments[:, 0]
+        dy = segments[:, 1] - segments[:, 3]  # Инвертируем ось Y
+        lengths = np.hypot(dx, dy)
+        angles = np.degrees(np.arctan2(dy, dx))
+
+        # Нормализуем углы к диапазону [-90, 90]
+        angles = np.where(angles < -90, angles + 180, angles)
+        angles = np.where(angles > 90, angles - 180, angles)
+
+        # Считаем линию горизонтальной (порог 20 градусов)
+        is_horizontal = (np.abs(angles) < 20) | (np.abs(np.abs(angles) - 180) < 20)
+        horizontal_count = int(np.count_nonzero(is_horizontal))
+
+        # Отладочная информация по каждой линии собирается только при DEBUG
+        if debug_enabled:
+            for i, (x1, y1, x2, y2) in enumerate(segments):
                 all_lines_debug.append({
                     'line_index': i,
                     'coords': (int(x1), int(y1), int(x2), int(y2)),
-                    'length': float(length),
+                    'length': float(lengths[i]),
                     'raw_angle': float(np.degrees(np.arctan2(y2 - y1, x2 - x1))),
-                    'corrected_angle': float(angle),
-                    'dx': dx,
-                    'dy': dy
+                    'corrected_angle': float(angles[i]),
+                    'dx': dx[i],
+                    'dy': dy[i]
                 })
-
                 logger.debug(
-                    f"DEBUG: Линия {i}: coords=({x1},{y1})-({x2},{y2}), length={length:.1f}, corrected_angle={angle:.2f}°")
-
-                # Считаем линию горизонтальной
-                is_horizontal = False
-                if abs(angle) < 20:  # Порог 20 градусов
-                    is_horizontal = True
-                elif abs(abs(angle) - 180) < 20:
-                    is_horizontal = True
-
-                if is_horizontal:
-                    horizontal_lines.append({
-                        'coords': (int(x1), int(y1), int(x2), int(y2)),
-                        'length': float(length),
-                        'angle': float(angle)
-                    })
-                    logger.debug(f"  ✓ Линия {i} считается горизонтальной (angle={angle:.2f}°)")
+                    f"DEBUG: Линия {i}: coords=({x1},{y1})-({x2},{y2}), length={lengths[i]:.1f}, corrected_angle={angles[i]:.2f}°")
+                if is_horizontal[i]:
+                    logger.debug(f"  ✓ Линия {i} считается горизонтальной (angle={angles[i]:.2f}°)")
                 else:
-                    logger.debug(f"  ✗ Линия {i} НЕ горизонтальная (angle={angle:.2f}°)")
-
-            logger.debug(f"DEBUG: Найдено горизонтальных линий: {len(horizontal_lines)}")
-
-            if horizontal_lines:
-                longest_line = max(horizontal_lines, key=lambda x: x['length'])
-                x1, y1, x2, y2 = longest_line['coords']
-                line_angle = longest_line['angle']
-
-                # Правильная логика поворота
-                rotation_angle = -line_angle
-
-                line_info = {
-                    'start': (x1, y1),
-                    'end': (x2, y2),
-                    'length': longest_line['length'],
-                    'detected_angle': line_angle,
-                    'rotation_angle': rotation_angle
-                }
+                    logger.debug(f"  ✗ Линия {i} НЕ горизонтальная (angle={angles[i]:.2f}°)")
+            logger.debug(f"DEBUG: Найдено горизонтальных линий: {horizontal_count}")
+
+        if horizontal_count:
+            # Самая длинная из горизонтальных линий
+            longest_idx = int(np.argmax(np.where(is_horizontal, lengths, -1)))
+            x1, y1, x2, y2 = (int(v) for v in segments[longest_idx])
+            line_length = float(lengths[longest_idx])
+            line_angle = float(angles[longest_idx])
+
+            # Правильная логика поворота
+            rotation_angle = -line_angle
+
+            line_info = {
+                'start': (x1, y1),
+                'end': (x2, y2),
+                'length': line_length,
+                'detected_angle': line_angle,
+                'rotation_angle': rotation_angle
+            }
 
-                logger.debug("=" * 50)
+            if debug_enabled:
+                logger.debug(_DEBUG_SEPARATOR)
                 logger.debug("DEBUG: ВЫБРАНА ЛИНИЯ ДЛЯ ПОВОРОТА")
                 logger.debug(f"Координаты: ({x1}, {y1}) - ({x2}, {y2})")
-                logger.debug(f"Длина: {longest_line['length']:.1f} пикселей")
+                logger.debug(f"Длина: {line_length:.1f} пикселей")
                 logger.debug(f"Угол линии: {line_angle:.2f}°")
                 logger.debug(f"Угол поворота: {rotation_angle:.2f}°")
-                logger.debug("=" * 50)
-            else:
-                logger.debug("DEBUG: НЕТ горизонтальных линий, поворот не требуется")
-                # Используем самую длинную линию как запасной вариант
-                if lines is not None and len(lines) > 0:
-                    all_lines = []
-                    for line in lines:
-                        x1, y1, x2, y2 = line[0]
-                        # ИСПРАВЛЕНО: правильное вычисление длины (второе место)
-                        length = np.sqrt((x2 - x1) ** 2 + (y2 - y1)**2)
-                        all_lines.append({
-                            'coords': (int(x1), int(y1), int(x2), int(y2)),
-                            'length': float(length)
-                        })
-
-                    longest_any_line = max(all_lines, key=lambda x: x['length'])
-                    x1, y1, x2, y2 = longest_any_line['coords']
-
-                    # Вычисляем угол для самой длинной линии
-                    dy = -(y2 - y1)
-                    dx = x2 - x1
-                    angle = np.degrees(np.arctan2(dy, dx))
-
-                    if angle < -90:
-                        angle += 180
-                    elif angle > 90:
-                        angle -= 180
-
-                    rotation_angle = -angle
-                    line_info = {
-                        'start': (x1, y1),
-                        'end': (x2, y2),
-                        'length': longest_any_line['length'],
-                        'detected_angle': angle,
-                        'rotation_angle': rotation_angle,
-                        'warning': 'Использована НЕ горизонтальная линия'
-                    }
-                    logger.debug(
-                        f"DEBUG: Использована самая длинная линия для поворота: angle={angle:.2f}°, rotation_angle={rotation_angle:.2f}°")
+                logger.debug(_DEBUG_SEPARATOR)
         else:
-            logger.debug("DEBUG: Не найдено линий для анализа")
+            if debug_enabled:
+                logger.debug("DEBUG: НЕТ горизонтальных линий, поворот не требуется")
+            # Используем самую длинную линию как запасной вариант,
+            # длины и углы уже посчитаны в первом проходе
+            longest_idx = int(np.argmax(lengths))
+            x1, y1, x2, y2 = (int(v) for v in segments[longest_idx])
+            angle = float(angles[longest_idx])
+
+            rotation_angle = -angle
+            line_info = {
+                'start': (x1, y1),
+                'end': (x2, y2),
+                'length': float(lengths[longest_idx]),
+                'detected_angle': angle,
+                'rotation_angle': rotation_angle,
+                'warning': 'Использована НЕ горизонтальная линия'
+            }
+            if debug_enabled:
+                logger.debug(
+                    f"DEBUG: Использована самая длинная линия для поворота: angle={angle:.2f}°, rotation_angle={rotation_angle:.2f}°")
+    elif debug_enabled:
+        logger.debug("DEBUG: Не найдено линий для анализа")
 
+    # Поворот на пренебрежимо малый угол не меняет изображение
+    if abs(rotation_angle) < _MIN_ROTATION_ANGLE:
+        rotation_angle = 0.0
+
+    if debug_enabled:
         logger.debug(f"DEBUG: Применяем поворот на угол: {rotation_angle:.2f}°")
 
+    if rotation_angle == 0.0 and image_format == _PIL_FORMATS[output_format]:
+        # Исходный файл уже в нужном формате: отдаём его без поворота и перекодирования
+        buffer = nparr
+        if debug_enabled:
+            logger.debug("DEBUG: Поворот не требуется, возвращается исходный файл")
+    else:
         # Поворачиваем оригинальное изображение
-        height, width = original_img.shape[:2]
-        center = (width // 2, height // 2)
-        rotation_matrix = cv2.getRotationMatrix2D(center, rotation_angle, 1.0)
-
-        rotated = cv2.warpAffine(original_img, rotation_matrix, (width, height),
-                                 flags=cv2.INTER_LINEAR,
-                                 borderMode=cv2.BORDER_CONSTANT,
-                                 borderValue=(255, 255, 255))
+        if original_img is None:
+            original_img = _decode_full(nparr)
+
+        right_angle = next((a for a in _RIGHT_ANGLE_ROTATIONS
+                            if abs(rotation_angle - a) < _MIN_ROTATION_ANGLE), None)
+
+        if rotation_angle == 0.0:
+            rotated = original_img
+        elif right_angle is not None:
+            # Точная перестановка пикселей; размеры сторон для 90° меняются местами
+            rotated = cv2.rotate(original_img, _RIGHT_ANGLE_ROTATIONS[right_angle])
+            if debug_enabled:
+                logger.debug(f"DEBUG: Поворот на {right_angle}° выполнен без интерполяции")
+        else:
+            height, width = original_img.shape[:2]
+            center = (width // 2, height // 2)
+            rotation_matrix = cv2.getRotationMatrix2D(center, rotation_angle, 1.0)
+
+            if interpolation == "auto":
+                is_binary = image_mode == "1" or _is_binary(original_img)
+                interpolation = "nearest" if is_binary else "linear"
+            warp_flags = _INTERPOLATION_FLAGS[interpolation]
+
+            if _HAS_CUDA:
+                gpu_img = cv2.cuda_GpuMat()
+                gpu_img.upload(original_img)
+                rotated = cv2.cuda.warpAffine(gpu_img, rotation_matrix, (width, height),
+                                              flags=warp_flags,
+                                              borderMode=cv2.BORDER_CONSTANT,
+                                              borderValue=(255, 255, 255)).download()
+            else:
+                rotated = cv2.warpAffine(original_img, rotation_matrix, (width, height),
+                                         flags=warp_flags,
+                                         borderMode=cv2.BORDER_CONSTANT,
+                                         borderValue=(255, 255, 255))
 
-        logger.debug("DEBUG: Поворот применен успешно")
+            if debug_enabled:
+                logger.debug(f"DEBUG: Поворот применен успешно, интерполяция: {interpolation}")
 
-        # Конвертируем в PNG
-        is_success, buffer = cv2.imencode(".png", rotated)
+        # Кодируем в выбранный формат
+        extension, encode_params = _ENCODE_PARAMS[output_format]
+        is_success, buffer = cv2.imencode(extension, rotated, encode_params)
         if not is_success or buffer.size == 0:
-            raise ValueError("Ошибка конвертации изображения в PNG")
-
-        logger.debug(f"DEBUG: Размер буфера PNG: {buffer.size} байт")
-
-        # Кодируем в base64
-        rotated_b64 = base64.b64encode(buffer).decode('utf-8')
-
-        # Формируем ответ
-        return {
-            "rotated_image_base64": rotated_b64,
-            "rotation_angle": rotation_angle,
-            "line_info": line_info,
-            "success": True,
-            "debug_info": {
-                "total_lines_found": line_count,
-                "horizontal_lines_found": len(horizontal_lines),
-                "edge_pixel_count": int(edge_count),
-                "image_shape": list(original_img.shape),
-                "applied_rotation_angle": rotation_angle
+            raise ValueError(f"Ошибка конвертации изображения в {output_format.upper()}")
+
+    if debug_enabled:
+        logger.debug(f"DEBUG: Размер буфера {output_format.upper()}: {buffer.size} байт")
+
+    if raw:
+        return Response(
+            content=buffer.tobytes(),
+            media_type=_MEDIA_TYPES[output_format],
+            headers={
+                "X-Rotation-Angle": str(rotation_angle),
+                "X-Line-Info": json.dumps(line_info)
             }
+        )
+
+    # Кодируем в base64
+    rotated_b64 = base64.b64encode(buffer).decode('ascii')
+
+    # Формируем ответ
+    return {
+        "rotated_image_base64": rotated_b64,
+        "rotation_angle": rotation_angle,
+        "line_info": line_info,
+        "success": True,
+        "debug_info": {
+            "total_lines_found": line_count,
+            "horizontal_lines_found": horizontal_count,
+            "edge_pixel_count": int(edge_count) if edge_count is not None else None,
+            "image_shape": image_shape,
+            "applied_rotation_angle": rotation_angle
         }
+    }
+
+
+async def rotate_image_endpoint(
+        file: UploadFile,
+        min_line_length: int = 50,
+        max_line_gap: int = 20,
+        use_morphology: bool = False,
+        debug_mode: bool = False,
+        output_format: str = "png",
+        raw: bool = False,
+        interpolation: str = "auto"
+) -> Union[Dict[str, Union[str, float, dict, bool, Optional[str]]], Response]:
+    """
+    Обработчик эндпоинта /rotate с безопасной инициализацией переменных
+
+    При raw=True изображение возвращается сырыми байтами без base64,
+    а угол поворота и найденная линия передаются в заголовках
+    X-Rotation-Angle и X-Line-Info.
+
+    Линии ищутся детектором FLD, если установлен opencv-contrib, иначе преобразованием Хафа
+    (на GPU или CPU). max_line_gap и use_morphology применяются только в пути Хафа:
+    FLD их не использует и не строит карту границ, поэтому debug_info.edge_pixel_count
+    для него равен None.
+    """
+    try:
+        if output_format not in _ENCODE_PARAMS:
+            raise ValueError(f"Неподдерживаемый формат вывода: {output_format}")
+        if interpolation != "auto" and interpolation not in _INTERPOLATION_FLAGS:
+            raise ValueError(f"Неподдерживаемая интерполяция: {interpolation}")
+
+        # Проверяем размер до чтения файла в память
+        await check_upload_size(file, settings.max_file_size)
+
+        # CPU-нагрузка выполняется в пуле потоков: OpenCV отпускает GIL,
+        # и event loop продолжает обслуживать другие запросы
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _rotate_executor, _rotate_sync, await file.read(), file.filename,
+            min_line_length, max_line_gap, use_morphology, output_format, raw, interpolation
+        )
 
     except Exception as e:
         logger.error(f"КРИТИЧЕСКАЯ ОШИБКА: {str(e)}")
-        logger.error(f"Трейсбек:\n{traceback.format_exc()}")
+        logger.debug("Трейсбек ошибки", exc_info=True)
 
         # Очищаем ошибку от непечатаемых символов
         safe_error = str(e).encode('utf-8', 'ignore').decode('utf-8')
-        safe_details = traceback.format_exc().encode('utf-8', 'ignore').decode('utf-8')[:500]
 
-        return {
+        result = {
             "rotated_image_base64": None,
             "rotation_angle": 0.0,
             "line_info": None,
             "success": False,
-            "error": safe_error,
-            "error_details": safe_details
-        }
\ No newline at end of file
+            "error": safe_error
+        }
+        # Трейсбек собираем только в режиме отладки
+        if settings.debug:
+            result["error_details"] = traceback.format_exc().encode('utf-8', 'ignore').decode('utf-8')[:500]
+        return result
\ No newline at end of file
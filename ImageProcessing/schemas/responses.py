@@ -2,29 +2,31 @@
 """
 Схемы ответов API
 """
+from typing import Optional
+
 from pydantic import BaseModel
 
 
 class BaseResponse(BaseModel):
     """Базовая схема ответа"""
     success: bool
-    message: str = None
+    message: Optional[str] = None
 
 
 class ConvertResponse(BaseResponse):
     """Схема ответа для конвертации"""
     images_base64: list
     count: int
-    details: dict = None
+    details: Optional[dict] = None
 
 
 class RotateResponse(BaseResponse):
     """Схема ответа для поворота"""
-    rotated_image_base64: str = None
+    rotated_image_base64: Optional[str] = None
     rotation_angle: float
-    line_info: dict = None
-    debug_info: dict = None
-    error: str = None
+    line_info: Optional[dict] = None
+    debug_info: Optional[dict] = None
+    error: Optional[str] = None
 
 
 class HealthCheckResponse(BaseModel):
@@ -32,13 +34,13 @@ class HealthCheckResponse(BaseModel):
     status: str
     timestamp: float
     version: str
-    uptime: float = None
+    uptime: Optional[float] = None
 
 
 class ErrorResponse(BaseModel):
     """Схема ошибочного ответа"""
     success: bool = False
     error: str
-    error_type: str = None
+    error_type: Optional[str] = None
     timestamp: float
-    details: dict = None
\ No newline at end of file
+    details: Optional[dict] = None
\ No newline at end of file
@@ -2,8 +2,10 @@
 """
 Пакет утилит для приложения
 """
-from .image_processing import binary_convert, find_longest_horizontal_line, rotate_image, apply_morphology
-from .pdf_processing import convert_pdf_to_images, images_to_base64
+from .image_processing import binary_convert, find_longest_horizontal_line, rotate_image, apply_morphology, close_open
+from .pdf_processing import convert_pdf_to_images, iter_pdf_pages, parse_page_range, images_to_base64
+from .pdf_cache import PDFRenderCache
+from .upload_processing import check_upload_size
 from .logging_config import setup_logging, get_logger
 
 __all__ = [
@@ -11,8 +13,13 @@ __all__ = [
     'find_longest_horizontal_line',
     'rotate_image',
     'apply_morphology',
+    'close_open',
     'convert_pdf_to_images',
+    'iter_pdf_pages',
+    'parse_page_range',
     'images_to_base64',
+    'PDFRenderCache',
+    'check_upload_size',
     'setup_logging',
     'get_logger'
 ]
\ No newline at end of file
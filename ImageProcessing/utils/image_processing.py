@@ -4,41 +4,44 @@
 """
 import cv2
 import numpy as np
-from PIL import Image
 from utils.logging_config import get_logger
-import io
 
 logger = get_logger(__name__)
 
-def binary_convert(image_bytes: bytes, threshold: int) -> bytes:
+# Параметры PNG для бинарных изображений: быстрый zlib (уровень 1) и 1 бит на пиксель,
+# энкодер сам упаковывает по 8 пикселей в байт
+_BINARY_PNG_PARAMS = [cv2.IMWRITE_PNG_COMPRESSION, 1, cv2.IMWRITE_PNG_BILEVEL, 1]
+
+# Прямоугольные структурные элементы для морфологии создаются один раз;
+# для прямоугольных ядер OpenCV использует быстрые специализированные проходы
+_MORPH_KERNEL_3X3 = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+_MORPH_KERNEL_5X5 = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+
+def binary_convert(img: np.ndarray, threshold: int) -> bytes:
     """
     Конвертирует изображение в бинарный формат (только черный и белый)
 
     Args:
-        image_bytes: Байты исходного изображения
+        img: Изображение в оттенках серого (uint8, 2D)
         threshold: Порог бинаризации (0-255)
 
     Returns:
         Байты бинарного изображения в формате PNG
     """
     try:
-        # Загружаем изображение
-        img = Image.open(io.BytesIO(image_bytes))
-
-        # Конвертируем в grayscale если необходимо
-        if img.mode != 'L':
-            img = img.convert('L')
+        if img is None or img.ndim != 2:
+            raise ValueError("Ожидается изображение в оттенках серого")
 
         # Применяем бинаризацию
         threshold = max(0, min(255, threshold))
-        img_bw = img.point(lambda x: 255 if x > threshold else 0, mode='1')
+        _, img_bw = cv2.threshold(img, threshold, 255, cv2.THRESH_BINARY)
 
-        # Сохраняем в PNG
-        output_buffer = io.BytesIO()
-        img_bw.save(output_buffer, format="PNG")
-        output_buffer.seek(0)
+        # Сохраняем в 1-битный PNG
+        is_success, buffer = cv2.imencode(".png", img_bw, _BINARY_PNG_PARAMS)
+        if not is_success:
+            raise ValueError("Ошибка конвертации бинарного изображения")
 
-        return output_buffer.getvalue()
+        return buffer.tobytes()
 
     except Exception as e:
         safe_error = str(e).encode('utf-8', 'ignore').decode('utf-8')
@@ -72,11 +75,9 @@ def find_longest_horizontal_line(image_bytes: bytes, min_line_length: int = 50,
         else:
             gray = img.copy()
 
-        # Применяем размытие для уменьшения шума
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-
-        # Детектируем границы
-        edges = cv2.Canny(blurred, 50, 150, apertureSize=3)
+        # Детектируем границы. Отдельное размытие не нужно: Canny сглаживает
+        # оператором Собеля, а для угла наклона мелкий шум не важен
+        edges = cv2.Canny(gray, 50, 150, apertureSize=3, L2gradient=False)
 
         # Находим линии с помощью преобразования Хафа
         lines = cv2.HoughLinesP(
@@ -91,39 +92,30 @@ def find_longest_horizontal_line(image_bytes: bytes, min_line_length: int = 50,
         if lines is None or len(lines) == 0:
             return None
 
-        # Фильтруем горизонтальные линии и находим самую длинную
-        horizontal_lines = []
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
-            length = np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-
-            # Вычисляем угол линии в градусах
-            angle = np.degrees(np.arctan2(y2 - y1, x2 - x1))
-
-            # Нормализуем угол к диапазону [-90, 90]
-            if angle < -90:
-                angle += 180
-            elif angle > 90:
-                angle -= 180
-
-            # Считаем линию горизонтальной, если угол близок к 0 или 180
-            if abs(angle) < 15 or abs(abs(angle) - 180) < 15:
-                horizontal_lines.append({
-                    'coords': (x1, y1, x2, y2),
-                    'length': length,
-                    'angle': angle
-                })
-
-        if not horizontal_lines:
+        # Считаем длины и углы всех линий одним векторным проходом
+        segments = lines.reshape(-1, 4)
+        dx = segments[:, 2] - segments[:, 0]
+        dy = segments[:, 3] - segments[:, 1]
+        lengths = np.hypot(dx, dy)
+
+        # Вычисляем углы линий в градусах и нормализуем к диапазону [-90, 90]
+        angles = np.degrees(np.arctan2(dy, dx))
+        angles = np.where(angles < -90, angles + 180, angles)
+        angles = np.where(angles > 90, angles - 180, angles)
+
+        # Считаем линию горизонтальной, если угол близок к 0 или 180
+        is_horizontal = (np.abs(angles) < 15) | (np.abs(np.abs(angles) - 180) < 15)
+        if not is_horizontal.any():
             return None
 
         # Находим самую длинную горизонтальную линию
-        longest_line = max(horizontal_lines, key=lambda x: x['length'])
+        idx = int(np.argmax(np.where(is_horizontal, lengths, -1)))
+        x1, y1, x2, y2 = segments[idx]
         return {
-            'start': (longest_line['coords'][0], longest_line['coords'][1]),
-            'end': (longest_line['coords'][2], longest_line['coords'][3]),
-            'length': longest_line['length'],
-            'angle': longest_line['angle']
+            'start': (x1, y1),
+            'end': (x2, y2),
+            'length': lengths[idx],
+            'angle': angles[idx]
         }
 
     except Exception as e:
@@ -158,7 +150,7 @@ def rotate_image(image_bytes: bytes, angle: float) -> bytes:
         rotated = cv2.warpAffine(img, rotation_matrix, (width, height), flags=cv2.INTER_LINEAR)
 
         # Конвертируем в PNG
-        is_success, buffer = cv2.imencode(".png", rotated)
+        is_success, buffer = cv2.imencode(".png", rotated, [cv2.IMWRITE_PNG_COMPRESSION, 1])
         if not is_success:
             raise ValueError("Ошибка конвертации повернутого изображения")
 
@@ -170,6 +162,25 @@ def rotate_image(image_bytes: bytes, angle: float) -> bytes:
         raise ValueError(f"Ошибка поворота изображения: {safe_error}")
 
 
+def close_open(img: np.ndarray) -> np.ndarray:
+    """
+    Морфологическое закрытие и затем открытие ядром 3x3
+
+    Закрытие (dilate, erode) соединяет разрывы линий, открытие (erode, dilate)
+    убирает шум. Две эрозии 3x3 подряд равны одной эрозии 5x5, поэтому
+    вместо четырёх проходов выполняется три, а промежуточный буфер переиспользуется.
+
+    Args:
+        img: Изображение в оттенках серого (не изменяется)
+
+    Returns:
+        Обработанное изображение
+    """
+    tmp = cv2.dilate(img, _MORPH_KERNEL_3X3)
+    cleaned = cv2.erode(tmp, _MORPH_KERNEL_5X5)
+    return cv2.dilate(cleaned, _MORPH_KERNEL_3X3, dst=tmp)
+
+
 def apply_morphology(image_bytes: bytes) -> bytes:
     """
     Применяет морфологические операции к бинарному изображению
@@ -188,12 +199,8 @@ def apply_morphology(image_bytes: bytes) -> bytes:
         if img is None:
             raise ValueError("Не удалось загрузить изображение для морфологии")
 
-        # Применяем морфологическое закрытие для соединения линий
-        kernel = np.ones((3, 3), np.uint8)
-        closed = cv2.morphologyEx(img, cv2.MORPH_CLOSE, kernel)
-
-        # Применяем морфологическое открытие для удаления шума
-        cleaned = cv2.morphologyEx(closed, cv2.MORPH_OPEN, kernel)
+        # Закрытие соединяет линии, открытие удаляет шум
+        cleaned = close_open(img)
 
         # Конвертируем обратно в байты
         is_success, buffer = cv2.imencode(".png", cleaned)
@@ -2,9 +2,13 @@
 """
 Модуль настройки логирования для приложения
 """
+import atexit
 import logging
+import logging.handlers
+import os
+import queue
 import sys
-from datetime import datetime
+import time
 from pathlib import Path
 
 
@@ -20,16 +24,74 @@ class ColoredFormatter(logging.Formatter):
         'RESET': '\033[0m'  # Reset
     }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Строка времени с точностью до секунды кэшируется: в одну секунду
+        # обычно попадает много записей
+        self._cached_second = None
+        self._cached_time = ''
+
     def format(self, record):
         log_color = self.COLORS.get(record.levelname, self.COLORS['RESET'])
         record.levelname_colored = f"{log_color}{record.levelname}{self.COLORS['RESET']}"
 
-        # Добавляем информацию о времени и модуле
-        record.timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+        # Добавляем информацию о времени и модуле из времени создания записи
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_second = second
+            self._cached_time = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        record.timestamp = f"{self._cached_time}.{int(record.msecs):03d}"
 
         return super().format(record)
 
 
+# Запись в консоль и файл выполняется в отдельном потоке слушателя очереди,
+# вызывающий код только кладёт запись в очередь
+_queue_handler = None
+_queue_listener = None
+
+
+def _start_listener(handlers) -> None:
+    """
+    Запускает слушатель очереди логов с заданными хендлерами
+
+    Args:
+        handlers: Хендлеры, выполняющие фактическую запись
+    """
+    global _queue_listener
+    log_queue = queue.SimpleQueue()
+    _queue_handler.queue = log_queue
+    _queue_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _queue_listener.start()
+
+
+def _stop_listener() -> None:
+    """Останавливает слушатель, дописывая оставшиеся в очереди записи"""
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+def _restart_listener_after_fork() -> None:
+    """
+    Перезапускает слушатель в дочернем процессе
+
+    Поток слушателя не переживает fork (например, gunicorn --preload),
+    поэтому в воркере создаются новая очередь и новый поток.
+    """
+    global _queue_listener
+    if _queue_listener is not None:
+        handlers = _queue_listener.handlers
+        _queue_listener = None
+        _start_listener(handlers)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
+atexit.register(_stop_listener)
+
+
 def setup_logging(log_level: str = "INFO",
                   log_file: str = None,
                   enable_console: bool = True,
@@ -43,12 +105,16 @@ def setup_logging(log_level: str = "INFO",
         enable_console: Включить логирование в консоль
         enable_file: Включить логирование в файл
     """
+    global _queue_handler
+
     # Создаем корневой логгер
     logger = logging.getLogger()
     logger.setLevel(getattr(logging, log_level.upper()))
 
-    # Очищаем существующие хендлеры
+    # Очищаем существующие хендлеры и останавливаем предыдущий слушатель
+    _stop_listener()
     logger.handlers.clear()
+    handlers = []
 
     # Формат сообщений
     console_format = ColoredFormatter(
@@ -64,7 +130,7 @@ def setup_logging(log_level: str = "INFO",
     if enable_console:
         console_handler = logging.StreamHandler(sys.stdout)
         console_handler.setFormatter(console_format)
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
 
     if enable_file and log_file:
         # Создаем директорию для логов, если не существует
@@ -73,7 +139,12 @@ def setup_logging(log_level: str = "INFO",
 
         file_handler = logging.FileHandler(log_file, encoding='utf-8')
         file_handler.setFormatter(file_format)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+
+    if handlers:
+        _queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+        _start_listener(handlers)
+        logger.addHandler(_queue_handler)
 
     return logger
 
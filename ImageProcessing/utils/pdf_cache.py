@@ -0,0 +1,63 @@
+# utils/pdf_cache.py
+"""
+Кэш результатов обработки PDF по хэшу содержимого
+"""
+import hashlib
+from collections import OrderedDict
+from typing import List, Optional
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class PDFRenderCache:
+    """LRU-кэш результатов обработки PDF, ограниченный суммарным размером в байтах"""
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Максимальный суммарный размер закэшированных данных (0 - кэш выключен)
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, List[bytes]]" = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+
+    @staticmethod
+    def make_key(pdf_bytes: bytes, *params) -> str:
+        """
+        Формирует ключ кэша из содержимого файла и параметров обработки
+
+        Args:
+            pdf_bytes: Байты PDF файла
+            params: Параметры, влияющие на результат (DPI, порог и т.п.)
+        """
+        digest = hashlib.blake2b(pdf_bytes, digest_size=16).hexdigest()
+        return ":".join([digest, *map(str, params)])
+
+    def get(self, key: str) -> Optional[List[bytes]]:
+        """Возвращает закэшированный результат или None"""
+        pages = self._entries.get(key)
+        if pages is not None:
+            self._entries.move_to_end(key)
+            logger.debug("Попадание в кэш PDF: %s", key)
+        return pages
+
+    def set(self, key: str, pages: List[bytes]) -> None:
+        """Сохраняет результат, вытесняя самые старые записи при превышении лимита"""
+        size = sum(len(page) for page in pages)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._total_bytes -= self._sizes.pop(key)
+            del self._entries[key]
+
+        self._entries[key] = pages
+        self._sizes[key] = size
+        self._total_bytes += size
+
+        while self._total_bytes > self.max_bytes:
+            old_key, _ = self._entries.popitem(last=False)
+            self._total_bytes -= self._sizes.pop(old_key)
+            logger.debug("Вытеснение из кэша PDF: %s", old_key)
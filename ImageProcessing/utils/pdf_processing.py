@@ -2,55 +2,143 @@
 """
 Утилиты для обработки PDF
 """
-from pdf2image import convert_from_bytes
+import fitz  # PyMuPDF
+import numpy as np
 import io
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional, Tuple
+from config import settings
 from utils.logging_config import get_logger
 
 logger = get_logger(__name__)
 
-def convert_pdf_to_images(pdf_bytes: bytes) -> list:
+# Пул для параллельного кодирования страниц в PNG/base64
+_encode_executor = ThreadPoolExecutor(settings.worker_threads, thread_name_prefix="pdf-b64")
+
+def parse_page_range(pages: str) -> Tuple[int, Optional[int]]:
     """
-    Конвертирует PDF в список изображений
+    Разбирает диапазон страниц вида "all", "3" или "1-3"
 
     Args:
-        pdf_bytes: Байты PDF файла
+        pages: Строка с диапазоном страниц (нумерация с 1)
 
     Returns:
-        Список изображений (PIL Image)
+        Кортеж (первая страница, последняя страница или None - до конца документа)
     """
+    pages = (pages or "all").strip().lower()
+    if pages == "all":
+        return 1, None
+
     try:
-        logger.info(f"Конвертация PDF, размер: {len(pdf_bytes)} байт")
-        images = convert_from_bytes(pdf_bytes)
-        logger.info(f"PDF успешно конвертирован в {len(images)} изображений")
-        return images
+        if "-" in pages:
+            first_str, last_str = pages.split("-", 1)
+            first, last = int(first_str), int(last_str)
+        else:
+            first = last = int(pages)
+    except ValueError:
+        raise ValueError(f"Некорректный диапазон страниц: {pages}. Ожидается 'all', 'N' или 'N-M'")
+
+    if first < 1 or last < first:
+        raise ValueError(f"Некорректный диапазон страниц: {pages}")
+
+    return first, last
+
+
+def iter_pdf_pages(pdf_bytes: bytes, dpi: int = 150,
+                   first_page: int = 1, last_page: Optional[int] = None) -> Iterator[np.ndarray]:
+    """
+    Лениво растеризует страницы PDF по одной
+
+    Args:
+        pdf_bytes: Байты PDF файла
+        dpi: Разрешение растеризации страниц
+        first_page: Первая страница (нумерация с 1)
+        last_page: Последняя страница включительно (None - до конца документа)
+
+    Yields:
+        Страница в оттенках серого (numpy uint8, 2D)
+    """
+    try:
+        logger.info("Конвертация PDF, размер: %d байт, DPI: %d", len(pdf_bytes), dpi)
+        zoom = dpi / 72
+        matrix = fitz.Matrix(zoom, zoom)
+
+        page_count = 0
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+            if first_page > doc.page_count:
+                raise ValueError(f"В документе {doc.page_count} страниц, запрошена страница {first_page}")
+
+            # Растеризуем только запрошенный диапазон страниц
+            stop = doc.page_count if last_page is None else min(last_page, doc.page_count)
+            for page in doc.pages(first_page - 1, stop):
+                # Растеризуем сразу в оттенки серого: бинаризации цвет не нужен
+                pix = page.get_pixmap(matrix=matrix, alpha=False, colorspace=fitz.csGRAY)
+                page_count += 1
+                # Смотрим прямо в буфер пиксмапа, без копии в PIL
+                yield np.frombuffer(pix.samples, np.uint8).reshape(pix.height, pix.width)
+
+        logger.info("PDF успешно конвертирован в %d изображений", page_count)
     except Exception as e:
         safe_error = str(e).encode('utf-8', 'ignore').decode('utf-8')
-        logger.error(f"Ошибка конвертации PDF: {safe_error}")
+        logger.error("Ошибка конвертации PDF: %s", safe_error)
         raise ValueError(f"Ошибка конвертации PDF: {safe_error}")
 
 
+def convert_pdf_to_images(pdf_bytes: bytes, dpi: int = 150,
+                          first_page: int = 1, last_page: Optional[int] = None) -> list:
+    """
+    Конвертирует PDF в список изображений
+
+    Args:
+        pdf_bytes: Байты PDF файла
+        dpi: Разрешение растеризации страниц
+        first_page: Первая страница (нумерация с 1)
+        last_page: Последняя страница включительно (None - до конца документа)
+
+    Returns:
+        Список страниц в оттенках серого (numpy uint8, 2D)
+    """
+    return list(iter_pdf_pages(pdf_bytes, dpi, first_page, last_page))
+
+
+def _image_to_base64(img) -> str:
+    """
+    Кодирует одно изображение PIL в PNG и затем в base64
+
+    Args:
+        img: Изображение PIL
+
+    Returns:
+        Строка base64
+    """
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", compress_level=1, optimize=False)
+    # Кодируем прямо из буфера без копии getvalue(); base64 - чистый ASCII
+    with buf.getbuffer() as view:
+        return base64.b64encode(view).decode('ascii')
+
+
 def images_to_base64(images: list) -> list:
     """
     Конвертирует список изображений в base64
 
+    Страницы кодируются параллельно: PIL отпускает GIL на время сжатия PNG.
+
     Args:
         images: Список изображений PIL
 
     Returns:
-        Список строк base64
+        Список строк base64 в порядке исходных изображений
     """
     try:
-        base64_list = []
-        for i, img in enumerate(images):
-            buf = io.BytesIO()
-            img.save(buf, format="PNG")
-            buf.seek(0)
-            base64_str = base64.b64encode(buf.getvalue()).decode('utf-8')
-            base64_list.append(base64_str)
-            logger.debug(f"Изображение {i+1}/{len(images)} сконвертировано в base64")
+        if len(images) <= 1:
+            base64_list = [_image_to_base64(img) for img in images]
+        else:
+            base64_list = list(_encode_executor.map(_image_to_base64, images))
+        logger.debug("Сконвертировано в base64 изображений: %d", len(base64_list))
         return base64_list
     except Exception as e:
         safe_error = str(e).encode('utf-8', 'ignore').decode('utf-8')
-        logger.error(f"Ошибка конвертации изображений в base64: {safe_error}")
-        raise ValueError(f"Ошибка конвертации изображений в base64: {safe_error}")
\ No newline at end of file
+        logger.error("Ошибка конвертации изображений в base64: %s", safe_error)
+        raise ValueError(f"Ошибка конвертации изображений в base64: {safe_error}")
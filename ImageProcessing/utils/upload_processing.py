@@ -0,0 +1,42 @@
+# utils/upload_processing.py
+"""
+Утилиты для работы с загруженными файлами
+"""
+from fastapi import UploadFile
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+# Размер чанка при потоковом чтении загрузки
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+async def check_upload_size(file: UploadFile, max_size: int) -> int:
+    """
+    Проверяет размер загруженного файла, не накапливая его в памяти
+
+    Starlette уже складывает тело запроса во временный файл (file.file),
+    поэтому размер считается по чанкам, а файл затем перематывается в начало.
+
+    Args:
+        file: Загруженный файл
+        max_size: Максимально допустимый размер в байтах
+
+    Returns:
+        Размер файла в байтах
+    """
+    size = file.size
+    if size is None:
+        size = 0
+        await file.seek(0)
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                break
+    await file.seek(0)
+
+    if size > max_size:
+        logger.warning("Файл %s превышает лимит: %d > %d байт", file.filename, size, max_size)
+        raise ValueError(f"Файл слишком большой. Максимальный размер: {max_size} байт")
+
+    return size
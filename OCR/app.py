@@ -5,28 +5,149 @@ Unified OCR Server — локальный запуск без Docker
 Поддержка многостраничных документов (PDF, изображения) с метрикой уверенности
 """
 
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import asynccontextmanager
+from functools import partial
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from PIL import Image
-import io
+import asyncio
+import logging
+import multiprocessing
+import tempfile
+import threading
 import torch
 import sys
 import os
 import time
-from typing import List, Tuple, Optional, Dict, Any
+import gc
+from typing import List, Tuple, Optional, Dict, Any, Callable, Awaitable
+
+# При запуске `python app.py` spawn-процессы пула растеризации заново выполняют этот файл как __mp_main__.
+# Логгер с хэндлером не настраивается повторно: без файла лога и баннера, его заменит инициализатор пула
+if __name__ == "__mp_main__":
+    logging.getLogger("ocr_server").addHandler(logging.NullHandler())
 
 # Импорт логгера (автоматическая инициализация происходит в utils/__init__.py)
-from utils import logger, PDFHandler, confidence_calculator
+from utils import logger, listen_to_queue, PDFHandler, confidence_calculator
+import pdf_worker
 
 # Добавляем текущую директорию в PATH
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-# Глобальное хранилище моделей (ленивая загрузка)
-models = {}
+# TF32 для оставшихся FP32-операций (Ampere+); FP16/BF16 матричные умножения не затрагивает
+torch.backends.cuda.matmul.allow_tf32 = True
+torch.backends.cudnn.allow_tf32 = True
+
+# Автотюнер cuDNN запоминает лучший алгоритм свёртки для каждой формы входа: страницы PDF
+# с одинаковым DPI дают одинаковые pixel_values. При очень разнородных изображениях отключите
+torch.backends.cudnn.benchmark = os.getenv("OCR_CUDNN_BENCHMARK", "1") == "1"
+
+# Освобождать кэш аллокатора CUDA после каждого запроса (для серверов с несколькими моделями)
+OCR_EMPTY_CACHE = os.getenv("OCR_EMPTY_CACHE", "0") == "1"
+
+# Режим весов transformers-моделей: fp16 | bf16 | int8 | nf4 (int8/nf4 требуют bitsandbytes)
+OCR_QUANTIZATION = os.getenv("OCR_QUANTIZATION", "fp16")
+
+# Примерный объём VRAM (ГБ), необходимый модели: веса FP16 + запас на KV-кэш
+MODEL_VRAM_GB = {
+    "deepseek-ocr": 4.0,
+    "deepseek-ocr2": 8.0,
+    "paddleocr-vl-1.5": 3.0,
+    "glm-ocr": 3.0,
+}
+
+# Доля от объёма FP16, которую занимает модель в выбранном режиме весов
+QUANT_VRAM_FACTOR = {"fp16": 1.0, "bf16": 1.0, "int8": 0.6, "nf4": 0.4}
+
+
+class ModelCache:
+    """
+    LRU-кэш загруженных моделей.
+    Перед загрузкой новой модели вытесняет давно не использовавшиеся,
+    пока свободной VRAM не хватит для новой модели.
+    """
+
+    def __init__(self):
+        self._models: "OrderedDict[str, Any]" = OrderedDict()
+        self.last_used: Dict[str, float] = {}
+
+    def __contains__(self, model_name: str) -> bool:
+        return model_name in self._models
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def keys(self) -> List[str]:
+        return list(self._models.keys())
+
+    def get(self, model_name: str):
+        """Возвращает модель и отмечает её как последнюю использованную"""
+        self._models.move_to_end(model_name)
+        self.last_used[model_name] = time.time()
+        return self._models[model_name]
+
+    def put(self, model_name: str, model) -> None:
+        """Добавляет загруженную модель в кэш"""
+        self._models[model_name] = model
+        self.last_used[model_name] = time.time()
+
+    def reserve(self, model_name: str) -> None:
+        """
+        Освобождает VRAM под загрузку модели, вытесняя модели в порядке LRU
+
+        Args:
+            model_name: имя модели, которую предстоит загрузить
+        """
+        if not torch.cuda.is_available():
+            return
+
+        required = MODEL_VRAM_GB.get(model_name, 0.0) * 1024 ** 3
+        if model_name != "paddleocr-vl-1.5":
+            required *= QUANT_VRAM_FACTOR.get(OCR_QUANTIZATION, 1.0)
+        while self._models and torch.cuda.mem_get_info(0)[0] < required:
+            evicted_name, _ = self._models.popitem(last=False)
+            self.last_used.pop(evicted_name, None)
+            logger.info(f"♻️  Модель '{evicted_name}' выгружена из VRAM (LRU) для загрузки '{model_name}'")
+            gc.collect()
+            torch.cuda.empty_cache()
+
+    def clear(self) -> None:
+        """Выгружает все модели"""
+        self._models.clear()
+        self.last_used.clear()
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+# Глобальное хранилище моделей (ленивая загрузка + LRU-вытеснение)
+models = ModelCache()
 model_load_times = {}  # Для отслеживания времени загрузки
-pdf_handler = PDFHandler(dpi=300)  # Обработчик PDF
+_model_lock = threading.Lock()  # Загрузка/выгрузка моделей из параллельных потоков
+# Ограничение длинной стороны страницы PDF в пикселях (0 — без ограничения, рендеринг в 300 DPI)
+OCR_MAX_LONG_EDGE = int(os.getenv("OCR_MAX_LONG_EDGE", "0"))
+pdf_handler = PDFHandler(dpi=300, max_long_edge=OCR_MAX_LONG_EDGE or None)  # Обработчик PDF
+
+# Загрузки до этого размера читаются в память, крупнее — потоково сбрасываются во временный файл
+UPLOAD_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1 << 20
+UPLOAD_HEADER_SIZE = 4096
+
+# Сигнатуры поддерживаемых изображений: JPEG, PNG, BMP, TIFF (LE/BE); WEBP проверяется отдельно
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"BM", b"II*\x00", b"MM\x00*")
+
+# Максимум страниц PDF в одном вызове generate() (ограничивает пиковое потребление VRAM)
+MAX_OCR_BATCH = max(1, int(os.getenv("MAX_OCR_BATCH", "4")))
+
+# Максимум одновременных инференсов (пакетов страниц/изображений) на сервер
+OCR_CONCURRENCY = max(1, int(os.getenv("OCR_CONCURRENCY", str(min(os.cpu_count() or 1, 4)))))
+_inference_semaphore = asyncio.Semaphore(OCR_CONCURRENCY)
+
+# Максимум пакетов страниц одного PDF, растеризованных и ожидающих инференса
+PDF_PIPELINE_DEPTH = max(1, int(os.getenv("PDF_PIPELINE_DEPTH", str(2 * OCR_CONCURRENCY))))
 
 
 @asynccontextmanager
@@ -58,19 +179,40 @@ async def lifespan(app: FastAPI):
     logger.info("  GET  /docs          — интерактивная документация (Swagger)")
     logger.info("=" * 70)
 
+    # Пул процессов для растеризации PDF: CPU-работа не блокирует event loop и не упирается в GIL.
+    # spawn — дочерние процессы не наследуют CUDA-контекст родителя; воркеры импортируют только
+    # лёгкий pdf_worker, а логи отправляют в очередь, которую этот процесс пишет в файл и консоль
+    mp_context = multiprocessing.get_context("spawn")
+    pdf_log_queue = mp_context.Queue()
+    pdf_log_listener = listen_to_queue(pdf_log_queue)
+    app.state.pdf_pool = ProcessPoolExecutor(
+        max_workers=os.cpu_count(),
+        mp_context=mp_context,
+        initializer=pdf_worker.init_worker,
+        initargs=(pdf_log_queue, logger.level)
+    )
+
+    # Предзагрузка моделей, чтобы первый запрос не ждал загрузки
+    preload = [name.strip() for name in os.getenv("PRELOAD_MODELS", "").split(",") if name.strip()]
+    for model_name in preload:
+        try:
+            get_model(model_name)
+        except Exception as e:
+            logger.error(f"❌ Не удалось предзагрузить модель '{model_name}': {str(e)}")
+
     yield  # Сервер работает здесь
 
     # ===== ON SHUTDOWN =====
     logger.info("\n" + "=" * 70)
     logger.info("🛑 Unified OCR Server останавливается...")
 
+    app.state.pdf_pool.shutdown(wait=False, cancel_futures=True)
+    pdf_log_listener.stop()
+
     # Освобождаем память моделей
-    global models
     if models:
         logger.info(f"Освобождение памяти: {len(models)} загруженных моделей")
-        for model_name in list(models.keys()):
-            del models[model_name]
-        torch.cuda.empty_cache()
+        models.clear()
         logger.info("✅ Память очищена")
 
     logger.info("=" * 70 + "\n")
@@ -93,28 +235,121 @@ app.add_middleware(
 )
 
 
-def validate_file_type(file_bytes: bytes, filename: str) -> Optional[str]:
+def validate_file_type(header: bytes) -> Optional[str]:
     """
-    Валидация типа файла
+    Определение типа файла по сигнатуре (magic bytes), а не по расширению
 
     Args:
-        file_bytes: байты файла
-        filename: имя файла
+        header: первые байты файла (достаточно UPLOAD_HEADER_SIZE)
 
     Returns:
         "pdf" | "image" | None (если не поддерживается)
     """
-    # Проверка расширения
-    ext = filename.lower().split('.')[-1]
-
-    if ext in ['pdf']:
+    # Сигнатура PDF может идти не с первого байта (допускается мусор перед заголовком)
+    if b"%PDF-" in header[:1024]:
         return "pdf"
-    elif ext in ['jpg', 'jpeg', 'png', 'bmp', 'tiff', 'webp']:
+    elif header.startswith(IMAGE_SIGNATURES) or (header[:4] == b"RIFF" and header[8:12] == b"WEBP"):
         return "image"
     else:
         return None
 
 
+def _load_model(model_name: str) -> None:
+    """
+    Загрузка модели в кэш (вызывается под _model_lock)
+
+    Args:
+        model_name: имя модели
+    """
+    logger.info(f"⏳ Загрузка модели '{model_name}'...")
+    models.reserve(model_name)
+    load_start = time.time()
+
+    try:
+        # === ЛОКАЛЬНЫЕ ИМПОРТЫ ДЛЯ ИЗОЛЯЦИИ ЗАВИСИМОСТЕЙ ===
+        if model_name == "deepseek-ocr":
+            from models.deepseek_ocr import DeepSeekOCRModel
+            models.put(model_name, DeepSeekOCRModel(quant=OCR_QUANTIZATION))
+        elif model_name == "deepseek-ocr2":
+            from models.deepseek_ocr2 import DeepSeekOCR2Model
+            models.put(model_name, DeepSeekOCR2Model(quant=OCR_QUANTIZATION))
+        elif model_name == "paddleocr-vl-1.5":
+            # Явный импорт только при необходимости
+            try:
+                from models.paddleocr_vl import PaddleOCRVLModel
+                models.put(model_name, PaddleOCRVLModel())
+            except ImportError as e:
+                error_msg = str(e)
+                if "paddlenlp" in error_msg.lower() or "aistudio_sdk" in error_msg.lower():
+                    raise RuntimeError(
+                        "Модель 'paddleocr-vl-1.5' недоступна: проблема с зависимостями paddlepaddle/paddlenlp.\n"
+                        "Рекомендуется использовать другие модели (glm-ocr, deepseek-ocr).\n"
+                        "Для исправления попробуйте: pip uninstall aistudio-sdk -y && pip install --upgrade paddlenlp"
+                    )
+                raise
+        elif model_name == "glm-ocr":
+            # Проверка наличия accelerate перед загрузкой
+            try:
+                import accelerate
+            except ImportError:
+                raise RuntimeError(
+                    "Модель 'glm-ocr' требует библиотеку 'accelerate'.\n"
+                    "Установите её командой: pip install accelerate"
+                )
+            from models.glm_ocr import GLMOCRModel
+            models.put(model_name, GLMOCRModel(quant=OCR_QUANTIZATION))
+        else:
+            raise ValueError(f"Неизвестная модель: {model_name}")
+
+        load_time = time.time() - load_start
+        model_load_times[model_name] = load_time
+        logger.info(f"✅ Модель '{model_name}' загружена за {load_time:.2f} сек")
+
+    except Exception as e:
+        error_msg = str(e)
+        logger.error(f"❌ Ошибка загрузки модели '{model_name}': {error_msg}", exc_info=True)
+
+        # Уточнение ошибок
+        if "404 Client Error" in error_msg and "deepseek-ocr2" in model_name:
+            error_msg = "DeepSeek-OCR 2 может быть недоступна на Hugging Face. Попробуйте другие модели."
+        elif "aistudio_sdk" in error_msg.lower():
+            error_msg = (
+                "Ошибка в зависимостях paddlepaddle/paddlenlp (aistudio_sdk).\n"
+                "Рекомендуется использовать другие модели (glm-ocr, deepseek-ocr).\n"
+                "Для исправления: pip uninstall aistudio-sdk -y && pip install --upgrade paddlenlp"
+            )
+        elif "paddlenlp" in error_msg.lower():
+            error_msg = (
+                "Зависимости paddlepaddle/paddlenlp не установлены или повреждены.\n"
+                "Рекомендуется использовать другие модели (glm-ocr, deepseek-ocr).\n"
+                "Для исправления: pip install paddlepaddle-gpu==2.6.1 -f https://www.paddlepaddle.org.cn/whl/linux/mkl/avx/stable.html && pip install paddlenlp==2.7.1"
+            )
+        elif "accelerate" in error_msg.lower():
+            error_msg = (
+                "Библиотека 'accelerate' не установлена. Требуется для модели glm-ocr.\n"
+                "Установите её: pip install accelerate"
+            )
+
+        raise RuntimeError(f"Ошибка загрузки модели {model_name}: {error_msg}")
+
+
+def get_model(model_name: str):
+    """
+    Получение модели по имени с загрузкой при первом запросе
+
+    Args:
+        model_name: имя модели
+
+    Returns:
+        Экземпляр модели
+    """
+    # Блокировка исключает двойную загрузку при параллельных запросах
+    with _model_lock:
+        if model_name not in models:
+            _load_model(model_name)
+        return models.get(model_name)
+
+
 def process_single_image_with_confidence(
         image: Image.Image,
         model_name: str,
@@ -133,87 +368,295 @@ def process_single_image_with_confidence(
     Returns:
         (распознанный текст, уверенность или None)
     """
-    # Загрузка модели при первом запросе
-    if model_name not in models:
-        logger.info(f"⏳ Загрузка модели '{model_name}'...")
-        load_start = time.time()
+    model = get_model(model_name)
 
-        try:
-            # === ЛОКАЛЬНЫЕ ИМПОРТЫ ДЛЯ ИЗОЛЯЦИИ ЗАВИСИМОСТЕЙ ===
-            if model_name == "deepseek-ocr":
-                from models.deepseek_ocr import DeepSeekOCRModel
-                models[model_name] = DeepSeekOCRModel()
-            elif model_name == "deepseek-ocr2":
-                from models.deepseek_ocr2 import DeepSeekOCR2Model
-                models[model_name] = DeepSeekOCR2Model()
-            elif model_name == "paddleocr-vl-1.5":
-                # Явный импорт только при необходимости
-                try:
-                    from models.paddleocr_vl import PaddleOCRVLModel
-                    models[model_name] = PaddleOCRVLModel()
-                except ImportError as e:
-                    error_msg = str(e)
-                    if "paddlenlp" in error_msg.lower() or "aistudio_sdk" in error_msg.lower():
-                        raise RuntimeError(
-                            "Модель 'paddleocr-vl-1.5' недоступна: проблема с зависимостями paddlepaddle/paddlenlp.\n"
-                            "Рекомендуется использовать другие модели (glm-ocr, deepseek-ocr).\n"
-                            "Для исправления попробуйте: pip uninstall aistudio-sdk -y && pip install --upgrade paddlenlp"
-                        )
-                    raise
-            elif model_name == "glm-ocr":
-                # Проверка наличия accelerate перед загрузкой
-                try:
-                    import accelerate
-                except ImportError:
-                    raise RuntimeError(
-                        "Модель 'glm-ocr' требует библиотеку 'accelerate'.\n"
-                        "Установите её командой: pip install accelerate"
-                    )
-                from models.glm_ocr import GLMOCRModel
-                models[model_name] = GLMOCRModel()
-            else:
-                raise ValueError(f"Неизвестная модель: {model_name}")
+    # Инференс
+    try:
+        result, confidence = model.infer(image, prompt, return_confidence)
+        return result, confidence
+    except Exception as e:
+        logger.error(f"❌ Ошибка инференса: {str(e)}", exc_info=True)
+        raise
 
-            load_time = time.time() - load_start
-            model_load_times[model_name] = load_time
-            logger.info(f"✅ Модель '{model_name}' загружена за {load_time:.2f} сек")
 
-        except Exception as e:
-            error_msg = str(e)
-            logger.error(f"❌ Ошибка загрузки модели '{model_name}': {error_msg}", exc_info=True)
-
-            # Уточнение ошибок
-            if "404 Client Error" in error_msg and "deepseek-ocr2" in model_name:
-                error_msg = "DeepSeek-OCR 2 может быть недоступна на Hugging Face. Попробуйте другие модели."
-            elif "aistudio_sdk" in error_msg.lower():
-                error_msg = (
-                    "Ошибка в зависимостях paddlepaddle/paddlenlp (aistudio_sdk).\n"
-                    "Рекомендуется использовать другие модели (glm-ocr, deepseek-ocr).\n"
-                    "Для исправления: pip uninstall aistudio-sdk -y && pip install --upgrade paddlenlp"
-                )
-            elif "paddlenlp" in error_msg.lower():
-                error_msg = (
-                    "Зависимости paddlepaddle/paddlenlp не установлены или повреждены.\n"
-                    "Рекомендуется использовать другие модели (glm-ocr, deepseek-ocr).\n"
-                    "Для исправления: pip install paddlepaddle-gpu==2.6.1 -f https://www.paddlepaddle.org.cn/whl/linux/mkl/avx/stable.html && pip install paddlenlp==2.7.1"
-                )
-            elif "accelerate" in error_msg.lower():
-                error_msg = (
-                    "Библиотека 'accelerate' не установлена. Требуется для модели glm-ocr.\n"
-                    "Установите её: pip install accelerate"
-                )
+def process_batch_with_confidence(
+        images: List[Image.Image],
+        model_name: str,
+        prompt: str,
+        return_confidence: bool
+) -> List[Tuple[str, Optional[float]]]:
+    """
+    Пакетная обработка изображений одним вызовом generate()
 
-            raise RuntimeError(f"Ошибка загрузки модели {model_name}: {error_msg}")
+    Args:
+        images: список PIL Image
+        model_name: имя модели
+        prompt: промпт для модели
+        return_confidence: возвращать ли метрику уверенности
+
+    Returns:
+        Список (распознанный текст, уверенность или None) в порядке images
+    """
+    model = get_model(model_name)
 
     # Инференс
     try:
-        result, confidence = models[model_name].infer(image, prompt, return_confidence)
-        return result, confidence
+        return model.infer_batch(images, prompt, return_confidence)
     except Exception as e:
-        logger.error(f"❌ Ошибка инференса: {str(e)}", exc_info=True)
+        logger.error(f"❌ Ошибка пакетного инференса: {str(e)}", exc_info=True)
         raise
 
 
+def _run_on_own_stream(fn, *args):
+    """
+    Выполнение fn в отдельном CUDA stream, чтобы параллельные инференсы
+    не сериализовались на default stream.
+    generate() одной модели защищён её собственной блокировкой: параллельно идут
+    предобработка и инференс разных моделей, а не два generate() одного экземпляра
+
+    Args:
+        fn: синхронная функция инференса
+        *args: её аргументы
+
+    Returns:
+        Результат fn
+    """
+    if not torch.cuda.is_available():
+        return fn(*args)
+
+    stream = torch.cuda.Stream()
+    with torch.cuda.stream(stream):
+        result = fn(*args)
+    stream.synchronize()
+    return result
+
+
+async def run_inference(fn, *args):
+    """
+    Запуск синхронного инференса в пуле потоков, не блокируя event loop.
+    Число одновременных запусков ограничено OCR_CONCURRENCY.
+
+    Args:
+        fn: синхронная функция инференса
+        *args: её аргументы
+
+    Returns:
+        Результат fn
+    """
+    async with _inference_semaphore:
+        return await asyncio.to_thread(_run_on_own_stream, fn, *args)
+
+
+def process_pdf_batch(
+        batch: List[Tuple[int, Optional[Image.Image]]],
+        total_pages: int,
+        model_name: str,
+        prompt: str,
+        return_confidence: bool,
+        request_id: str
+) -> Tuple[List[Dict[str, Any]], List[float]]:
+    """
+    Обработка пакета страниц PDF; страницы без изображения (ошибка растеризации)
+    получают результат с ошибкой, чтобы ответ содержал каждую страницу документа
+
+    Args:
+        batch: список (номер страницы, PIL Image или None, если страницу не удалось растеризовать)
+        total_pages: общее число страниц документа (для логов)
+        model_name: имя модели
+        prompt: промпт для модели
+        return_confidence: возвращать ли метрику уверенности
+        request_id: идентификатор запроса (для логов)
+
+    Returns:
+        (результаты по страницам, уверенности по страницам) в порядке страниц
+    """
+    rendered = [(page_num, page_image) for page_num, page_image in batch if page_image is not None]
+    failed = [page_num for page_num, page_image in batch if page_image is None]
+
+    results, page_confidences = [], []
+    if rendered:
+        results, page_confidences = _process_rendered_pages(
+            rendered, total_pages, model_name, prompt, return_confidence, request_id
+        )
+    if not failed:
+        return results, page_confidences
+
+    for page_num in failed:
+        logger.error(f"[{request_id}] ❌ Страница {page_num} не растеризована, пропуск инференса")
+        results.append({
+            "page_number": page_num,
+            "error": "Не удалось растеризовать страницу PDF",
+            "text": None,
+            "confidence": None,
+            "timing_seconds": 0
+        })
+        page_confidences.append(0.1)  # Низкая уверенность при ошибке
+
+    # Восстанавливаем порядок страниц
+    ordered = sorted(zip(results, page_confidences), key=lambda item: item[0]["page_number"])
+    return [result for result, _ in ordered], [confidence for _, confidence in ordered]
+
+
+def _process_rendered_pages(
+        batch: List[Tuple[int, Image.Image]],
+        total_pages: int,
+        model_name: str,
+        prompt: str,
+        return_confidence: bool,
+        request_id: str
+) -> Tuple[List[Dict[str, Any]], List[float]]:
+    """
+    Обработка пакета страниц PDF одним вызовом generate() с постраничным откатом при ошибке
+
+    Args:
+        batch: список (номер страницы, PIL Image)
+        total_pages: общее число страниц документа (для логов)
+        model_name: имя модели
+        prompt: промпт для модели
+        return_confidence: возвращать ли метрику уверенности
+        request_id: идентификатор запроса (для логов)
+
+    Returns:
+        (результаты по страницам, уверенности по страницам)
+    """
+    results = []
+    page_confidences = []
+
+    batch_start = time.time()
+    logger.info(f"[{request_id}] 📄 Страницы {batch[0][0]}-{batch[-1][0]}/{total_pages}...")
+
+    try:
+        batch_results = process_batch_with_confidence(
+            [page_image for _, page_image in batch], model_name, prompt, return_confidence
+        )
+    except Exception as e:
+        # Пакет не прошёл (например, OOM) — обрабатываем его страницы по одной
+        logger.warning(f"[{request_id}] ⚠️  Пакетный инференс не удался ({str(e)}), постраничная обработка")
+        batch_results = None
+
+    if batch_results is not None:
+        page_time = round((time.time() - batch_start) / len(batch), 2)
+        for (page_num, _), (text, confidence) in zip(batch, batch_results):
+            page_confidences.append(confidence if confidence is not None else 0.5)
+            results.append({
+                "page_number": page_num,
+                "text": text,
+                "confidence": confidence,
+                "timing_seconds": page_time
+            })
+
+        logger.info(
+            f"[{request_id}] ✅ Страницы {batch[0][0]}-{batch[-1][0]} обработаны за {time.time() - batch_start:.2f} сек")
+        return results, page_confidences
+
+    for page_num, page_image in batch:
+        page_start = time.time()
+        logger.info(f"[{request_id}] 📄 Страница {page_num}/{total_pages}...")
+
+        try:
+            text, confidence = process_single_image_with_confidence(
+                page_image, model_name, prompt, return_confidence
+            )
+            page_confidences.append(confidence if confidence is not None else 0.5)
+
+            results.append({
+                "page_number": page_num,
+                "text": text,
+                "confidence": confidence,
+                "timing_seconds": round(time.time() - page_start, 2)
+            })
+
+            logger.info(
+                f"[{request_id}] ✅ Страница {page_num} обработана за {time.time() - page_start:.2f} сек" +
+                (f" | Уверенность: {confidence:.2f}" if confidence else ""))
+
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"[{request_id}] ❌ Ошибка обработки страницы {page_num}: {error_msg}", exc_info=True)
+            # Продолжаем обработку остальных страниц
+            results.append({
+                "page_number": page_num,
+                "error": error_msg,
+                "text": None,
+                "confidence": None,
+                "timing_seconds": round(time.time() - page_start, 2)
+            })
+            page_confidences.append(0.1)  # Низкая уверенность при ошибке
+
+    return results, page_confidences
+
+
+async def process_pdf_upload(
+        upload: UploadFile,
+        process_pages: Callable[[List[Tuple[int, Optional[Image.Image]]], int], Awaitable[Any]]
+) -> Tuple[int, List[Any]]:
+    """
+    Растеризация загруженного PDF в пуле процессов с передачей страниц в обработку по мере готовности.
+    Небольшие файлы передаются байтами, крупные потоково сбрасываются во временный файл,
+    чтобы не держать в памяти одновременно весь PDF и изображения его страниц.
+
+    Args:
+        upload: загруженный файл
+        process_pages: корутина обработки пакета страниц (страницы, всего страниц в документе)
+
+    Returns:
+        (число страниц документа, результаты process_pages в порядке страниц)
+    """
+    # В процесс пула передаётся функция лёгкого модуля pdf_worker, а не метод PDFHandler:
+    # иначе воркер импортировал бы пакет utils вместе с torch и настройкой логгера
+    render = partial(pdf_worker.render_pages, dpi=pdf_handler.dpi, max_long_edge=pdf_handler.max_long_edge)
+
+    if upload.size is not None and upload.size <= UPLOAD_SPOOL_MAX_SIZE:
+        pdf_bytes = await upload.read()
+        return await process_pdf_pages(render, pdf_bytes, process_pages)
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as spool:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            spool.write(chunk)
+        spool.flush()
+        return await process_pdf_pages(render, spool.name, process_pages)
+
+
+async def process_pdf_pages(render, source, process_pages) -> Tuple[int, List[Any]]:
+    """
+    Конвейер растеризация → инференс: документ делится на диапазоны по MAX_OCR_BATCH страниц,
+    каждый диапазон рендерится отдельным процессом пула (MuPDF не отпускает GIL) и сразу
+    передаётся в process_pages, пока следующие диапазоны ещё растеризуются.
+
+    Задачи для всех диапазонов создаются сразу (по одной корутине на пакет страниц документа),
+    но растеризацию и инференс проходят одновременно не больше PDF_PIPELINE_DEPTH из них —
+    семафор ограничивает число изображений страниц в памяти, а не число задач.
+
+    Страницы, которые не удалось растеризовать, передаются в process_pages с изображением None,
+    чтобы в ответе был результат (с ошибкой) для каждой страницы документа.
+
+    Args:
+        render: функция растеризации (source, page_range) -> [(номер страницы, изображение)],
+            выполняется в процессе пула
+        source: байты PDF или путь к файлу
+        process_pages: корутина обработки пакета страниц (страницы, всего страниц в документе)
+
+    Returns:
+        (число страниц документа, результаты process_pages в порядке страниц)
+    """
+    loop = asyncio.get_running_loop()
+
+    total_pages = await asyncio.to_thread(pdf_handler.count_pages, source)
+    in_flight = asyncio.Semaphore(PDF_PIPELINE_DEPTH)
+
+    async def render_and_process(page_range: range):
+        async with in_flight:
+            rendered = dict(await loop.run_in_executor(app.state.pdf_pool, render, source, page_range))
+            batch = [(page_index + 1, rendered.get(page_index + 1)) for page_index in page_range]
+            return await process_pages(batch, total_pages)
+
+    outputs = await asyncio.gather(*[
+        render_and_process(range(start, min(start + MAX_OCR_BATCH, total_pages)))
+        for start in range(0, total_pages, MAX_OCR_BATCH)
+    ])
+    return total_pages, outputs
+
+
 @app.get("/")
 async def root():
     """Простая главная страница"""
@@ -240,16 +683,18 @@ async def list_models():
     ]
 
     loaded_info = {}
+    now = time.time()
     for model_name in models.keys():
         load_time = model_load_times.get(model_name, "N/A")
         loaded_info[model_name] = {
             "status": "loaded",
-            "load_time_sec": round(load_time, 2) if isinstance(load_time, float) else load_time
+            "load_time_sec": round(load_time, 2) if isinstance(load_time, float) else load_time,
+            "idle_sec": round(now - models.last_used[model_name], 2)
         }
 
     return {
         "available_models": available,
-        "loaded_models": list(models.keys()),
+        "loaded_models": models.keys(),
         "loaded_models_details": loaded_info,
         "cuda_available": torch.cuda.is_available(),
         "gpu_name": torch.cuda.get_device_name(0) if torch.cuda.is_available() else None,
@@ -285,10 +730,11 @@ async def ocr_inference(
         logger.error(f"[{request_id}] ❌ {error_msg}")
         raise HTTPException(status_code=400, detail=error_msg)
 
-    # Чтение файла
+    # Определение типа файла по сигнатуре (UploadFile уже буферизован Starlette, читаем только заголовок)
     try:
-        file_bytes = await image.read()
-        file_type = validate_file_type(file_bytes, image.filename)
+        header = await image.read(UPLOAD_HEADER_SIZE)
+        await image.seek(0)
+        file_type = validate_file_type(header)
 
         if file_type is None:
             raise HTTPException(
@@ -296,7 +742,7 @@ async def ocr_inference(
                 detail=f"Неподдерживаемый формат файла: {image.filename}. Поддерживаются: PDF, JPG, PNG, BMP, TIFF, WEBP"
             )
 
-        logger.debug(f"[{request_id}] 📁 Тип файла: {file_type.upper()} | Размер: {len(file_bytes) / 1024:.1f} KB")
+        logger.debug(f"[{request_id}] 📁 Тип файла: {file_type.upper()} | Размер: {(image.size or 0) / 1024:.1f} KB")
 
     except Exception as e:
         logger.error(f"[{request_id}] ❌ Ошибка чтения файла: {str(e)}", exc_info=True)
@@ -308,52 +754,25 @@ async def ocr_inference(
             # Обработка многостраничного PDF
             logger.info(f"[{request_id}] 📄 Обработка многостраничного PDF...")
 
-            # Конвертация PDF в изображения
+            async def ocr_pages(batch: List[Tuple[int, Optional[Image.Image]]], total_pages: int):
+                return await run_inference(
+                    process_pdf_batch, batch, total_pages, model_name, prompt, return_confidence, request_id
+                )
+
+            # Пакеты страниц распознаются по мере растеризации (параллельно, в пределах OCR_CONCURRENCY)
             try:
-                pages = pdf_handler.pdf_bytes_to_images(file_bytes)
+                total_pages, batch_outputs = await process_pdf_upload(image, ocr_pages)
             except ValueError as e:
                 raise HTTPException(status_code=400, detail=str(e))
 
-            if not pages:
+            if not batch_outputs:
                 raise HTTPException(status_code=400, detail="PDF файл не содержит страниц")
 
-            # Обработка каждой страницы
             results = []
             page_confidences = []
-
-            for page_num, page_image in pages:
-                page_start = time.time()
-                logger.info(f"[{request_id}] 📄 Страница {page_num}/{len(pages)}...")
-
-                try:
-                    text, confidence = process_single_image_with_confidence(
-                        page_image, model_name, prompt, return_confidence
-                    )
-                    page_confidences.append(confidence if confidence is not None else 0.5)
-
-                    results.append({
-                        "page_number": page_num,
-                        "text": text,
-                        "confidence": confidence,
-                        "timing_seconds": round(time.time() - page_start, 2)
-                    })
-
-                    logger.info(
-                        f"[{request_id}] ✅ Страница {page_num} обработана за {time.time() - page_start:.2f} сек" +
-                        (f" | Уверенность: {confidence:.2f}" if confidence else ""))
-
-                except Exception as e:
-                    error_msg = str(e)
-                    logger.error(f"[{request_id}] ❌ Ошибка обработки страницы {page_num}: {error_msg}", exc_info=True)
-                    # Продолжаем обработку остальных страниц
-                    results.append({
-                        "page_number": page_num,
-                        "error": error_msg,
-                        "text": None,
-                        "confidence": None,
-                        "timing_seconds": round(time.time() - page_start, 2)
-                    })
-                    page_confidences.append(0.1)  # Низкая уверенность при ошибке
+            for batch_results, batch_confidences in batch_outputs:
+                results.extend(batch_results)
+                page_confidences.extend(batch_confidences)
 
             # Расчёт общей уверенности для документа (минимальная по страницам для консервативности)
             overall_confidence = min(page_confidences) if page_confidences else None
@@ -362,18 +781,22 @@ async def ocr_inference(
 
             logger.info(f"[{request_id}] ✅ PDF обработан | Всего: {total_time:.2f} сек | Страниц: {len(results)}")
 
-            # Объединяем текст всех страниц
-            combined_text = "\n\n--- СТРАНИЦА РАЗДЕЛИТЕЛЬ ---\n\n".join(
-                f"[Страница {r['page_number']}]\n{r['text']}"
-                for r in results if r.get('text')
-            )
+            # Объединяем текст всех страниц и собираем тайминги за один проход
+            text_parts = []
+            page_timings = []
+            for r in results:
+                if r.get('text'):
+                    text_parts.append(f"[Страница {r['page_number']}]\n{r['text']}")
+                page_timings.append(r.get('timing_seconds', 0))
+
+            combined_text = "\n\n--- СТРАНИЦА РАЗДЕЛИТЕЛЬ ---\n\n".join(text_parts)
 
             return {
                 "model": model_name,
                 "prompt": prompt,
                 "file_type": "pdf",
-                "total_pages": len(pages),
-                "processed_pages": len([r for r in results if r.get('text')]),
+                "total_pages": total_pages,
+                "processed_pages": len(text_parts),
                 "pages": results,
                 "combined_text": combined_text,
                 "confidence": overall_confidence,
@@ -381,7 +804,7 @@ async def ocr_inference(
                 "status": "success",
                 "timing": {
                     "total_seconds": round(total_time, 2),
-                    "pages": [r.get('timing_seconds', 0) for r in results]
+                    "pages": page_timings
                 },
                 "request_id": request_id
             }
@@ -391,15 +814,15 @@ async def ocr_inference(
             logger.debug(f"[{request_id}] 🖼️  Обработка изображения...")
 
             try:
-                img = Image.open(io.BytesIO(file_bytes)).convert("RGB")
+                img = Image.open(image.file).convert("RGB")
             except Exception as e:
                 logger.error(f"[{request_id}] ❌ Ошибка обработки изображения: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=400, detail=f"Ошибка обработки изображения: {str(e)}")
 
             # Инференс
             infer_start = time.time()
-            text, confidence = process_single_image_with_confidence(
-                img, model_name, prompt, return_confidence
+            text, confidence = await run_inference(
+                process_single_image_with_confidence, img, model_name, prompt, return_confidence
             )
             infer_time = time.time() - infer_start
 
@@ -423,6 +846,10 @@ async def ocr_inference(
                 "request_id": request_id
             }
 
+    except HTTPException:
+        # Ошибки клиента (400) отдаются как есть, без превращения в 500
+        raise
+
     except Exception as e:
         error_msg = str(e)
         logger.error(f"[{request_id}] ❌ Ошибка обработки: {error_msg}", exc_info=True)
@@ -435,6 +862,12 @@ async def ocr_inference(
 
         raise HTTPException(status_code=500, detail=detail_msg)
 
+    finally:
+        # Возврат неиспользуемых блоков кэширующего аллокатора драйверу CUDA (чтобы могла
+        # загрузиться другая модель). Стоит ~5–20 мс и удорожает следующие аллокации — по умолчанию выключено
+        if OCR_EMPTY_CACHE and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -1 +1,32 @@
+# models/__init__.py
 
+"""
+Единая точка импорта моделей OCR.
+Модули моделей (и transformers/torch/paddle за ними) импортируются лениво — при первом обращении к классу.
+"""
+
+import importlib
+
+_MODEL_MODULES = {
+    "BaseOCRModel": "models.base",
+    "DeepSeekOCRModel": "models.deepseek_ocr",
+    "DeepSeekOCR2Model": "models.deepseek_ocr2",
+    "PaddleOCRVLModel": "models.paddleocr_vl",
+    "GLMOCRModel": "models.glm_ocr",
+}
+
+__all__ = list(_MODEL_MODULES)
+
+
+def __getattr__(name: str):
+    module_name = _MODEL_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'models' has no attribute '{name}'")
+
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value  # Следующие обращения не проходят через __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,328 @@
+# models/base.py
+
+"""
+Общая основа обёрток transformers-моделей OCR:
+загрузка весов, пакетный generate(), декодирование, уверенность и логирование
+"""
+
+from transformers import AutoProcessor, AutoModelForCausalLM, LogitsProcessorList, StoppingCriteria, StoppingCriteriaList
+import torch
+import logging
+import importlib.util
+from PIL import Image
+from utils import logger, confidence_calculator
+from utils.confidence import ConfidenceAccumulator
+from models.quantization import QuantMode, quantization_kwargs
+import os
+import threading
+import time
+from typing import List, Tuple, Optional
+
+
+def default_attn_implementation() -> str:
+    """
+    Реализация attention для from_pretrained: переменная OCR_ATTN_IMPLEMENTATION,
+    иначе FlashAttention 2 при установленном flash_attn, иначе SDPA (PyTorch scaled_dot_product_attention)
+
+    Returns:
+        "flash_attention_2" | "sdpa" | "eager"
+    """
+    attn_implementation = os.getenv("OCR_ATTN_IMPLEMENTATION")
+    if attn_implementation:
+        return attn_implementation
+    if torch.cuda.is_available() and importlib.util.find_spec("flash_attn") is not None:
+        return "flash_attention_2"
+    return "sdpa"
+
+
+class StopOnRepetition(StoppingCriteria):
+    """
+    Остановка строки пакета, зациклившейся на коротком цикле токенов.
+
+    Без остановки такая строка крутится до max_new_tokens и держит весь пакет.
+    Порог высокий: отточия, подчёркивания и линейки таблиц дают короткие повторы
+    и не должны обрезаться, а зацикливание повторяет один цикл сотню токенов подряд.
+    """
+
+    def __init__(self, prompt_length: int, window: int = 128, max_period: int = 8):
+        """
+        Args:
+            prompt_length: длина промпта (с паддингом) — повторы в промпте не учитываются
+            window: сколько последних токенов должны повторять цикл, чтобы считать строку зациклившейся
+            max_period: максимальная длина цикла (n-граммы) в токенах
+        """
+        self.prompt_length = prompt_length
+        self.window = window
+        self.max_period = max_period
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        stop = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        generated = input_ids.shape[1] - self.prompt_length
+        tail = input_ids[:, -self.window:]
+        for period in range(1, self.max_period + 1):
+            if generated < self.window + period:
+                break
+            # Хвост совпадает со своим сдвигом на period — последние window токенов повторяют один цикл
+            shifted = input_ids[:, -self.window - period:-period]
+            stop |= (tail == shifted).all(dim=1)
+        return stop
+
+
+class BaseOCRModel:
+    """
+    Базовая обёртка OCR-модели Hugging Face.
+
+    Наследники задают display_name/default_prompt и при необходимости переопределяют хуки:
+    _load_processor, _build_inputs, _decode, _on_load_error.
+    """
+
+    display_name: str = "OCR"
+    default_prompt: str = "Extract all text"
+
+    def __init__(
+            self,
+            hf_id: str,
+            model_cls=AutoModelForCausalLM,
+            max_new_tokens: int = 1024,
+            quant: QuantMode = "fp16"
+    ):
+        """
+        Args:
+            hf_id: идентификатор модели на Hugging Face
+            model_cls: Auto-класс для from_pretrained
+            max_new_tokens: максимум генерируемых токенов
+            quant: режим весов — fp16 | bf16 | int8 | nf4 (int8/nf4 через bitsandbytes)
+        """
+        logger.info(f"⏳ Загрузка модели {self.display_name}...")
+
+        self.hf_id = hf_id
+        self.max_new_tokens = max_new_tokens
+        self._generate_lock = threading.Lock()
+
+        try:
+            start_time = time.time()
+
+            load_kwargs = dict(trust_remote_code=True, **quantization_kwargs(quant), device_map="auto")
+            attn_implementation = default_attn_implementation()
+            try:
+                self.model = model_cls.from_pretrained(hf_id, attn_implementation=attn_implementation, **load_kwargs)
+            except (ValueError, ImportError) as e:
+                # Модели с trust_remote_code могут не поддерживать выбранную реализацию attention
+                logger.warning(f"⚠️  {self.display_name}: attention '{attn_implementation}' недоступен ({str(e)}), загрузка с реализацией по умолчанию")
+                self.model = model_cls.from_pretrained(hf_id, **load_kwargs)
+            self.processor = self._load_processor(hf_id)
+
+            if os.getenv("OCR_TORCH_COMPILE", "0") == "1":
+                if getattr(self.model, "_supports_static_cache", False):
+                    # Статический KV-кэш: generate() сам компилирует только шаг декодирования
+                    # (reduce-overhead, CUDA graphs). Форма шага [пакет, 1] не зависит от длины промпта,
+                    # поэтому графы записываются по одному на размер пакета (не больше MAX_OCR_BATCH),
+                    # а prefill переменной длины выполняется без компиляции
+                    self.model.generation_config.cache_implementation = "static"
+                else:
+                    # Без статического кэша формы шагов меняются вместе с длиной кэша: CUDA graphs
+                    # перезаписывались бы на каждом шаге, поэтому только слияние ядер без графов
+                    self.model.forward = torch.compile(self.model.forward, mode="default", dynamic=True)
+
+                # Прогрев: компиляция при загрузке, а не на первом запросе пользователя
+                warmup_start = time.time()
+                self._generate([Image.new("RGB", (224, 224), "white")], self.default_prompt, False)
+                logger.info(f"🔥 {self.display_name} прогрета за {time.time() - warmup_start:.2f} сек")
+
+            load_time = time.time() - start_time
+            device = next(self.model.parameters()).device
+
+            logger.info(f"✅ {self.display_name} загружена за {load_time:.2f} сек | Устройство: {device}")
+            # Подсчёт параметров обходит все тензоры модели — только при включённом DEBUG
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"   Параметры модели: {sum(p.numel() for p in self.model.parameters()) / 1e9:.1f}B")
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка загрузки {self.display_name}: {str(e)}", exc_info=True)
+            self._on_load_error(e)
+            raise
+
+    # ===== Хуки для наследников =====
+
+    def _load_processor(self, hf_id: str):
+        """Загрузка процессора (токенизатор + обработка изображений)"""
+        return AutoProcessor.from_pretrained(hf_id, trust_remote_code=True)
+
+    def _build_inputs(self, images: List[Image.Image], prompt: str):
+        """
+        Подготовка входов generate() для пакета изображений с общим промптом
+
+        Args:
+            images: список PIL Image в формате RGB
+            prompt: инструкция для модели
+
+        Returns:
+            BatchFeature с input_ids, attention_mask, pixel_values и т.д.
+        """
+        if len(images) == 1:
+            return self.processor(images=images[0], text=prompt, return_tensors="pt")
+        # generate() для decoder-only моделей требует левого паддинга; задаётся на вызов,
+        # а не через общий tokenizer.padding_side, который читают параллельные потоки
+        return self.processor(
+            images=images,
+            text=[prompt] * len(images),
+            return_tensors="pt",
+            padding=True,
+            padding_side="left"
+        )
+
+    def _decode(self, generated_ids: torch.Tensor, prompt_length: int) -> str:
+        """
+        Декодирование одной сгенерированной последовательности
+
+        Args:
+            generated_ids: промпт + сгенерированные токены [seq_len]
+            prompt_length: длина промпта (с паддингом)
+
+        Returns:
+            Распознанный текст
+        """
+        return self.processor.decode(generated_ids, skip_special_tokens=True)
+
+    def _on_load_error(self, error: Exception) -> None:
+        """Дополнительные подсказки в лог при ошибке загрузки"""
+
+    # ===== Инференс =====
+
+    def infer(self, image: Image.Image, prompt: Optional[str] = None, return_confidence: bool = False) -> Tuple[str, Optional[float]]:
+        """
+        Распознавание текста с изображения
+
+        Args:
+            image: PIL Image в формате RGB
+            prompt: инструкция для модели (по умолчанию default_prompt)
+            return_confidence: возвращать ли метрику уверенности
+
+        Returns:
+            (распознанный текст, уверенность или None)
+        """
+        start_time = time.time()
+        prompt = prompt or self.default_prompt
+
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"📝 {self.display_name} инференс | Промпт: {prompt[:50]}...")
+                logger.debug(f"   Размер изображения: {image.size} | Формат: {image.mode}")
+
+            result, confidence = self._generate([image], prompt, return_confidence)[0]
+
+            infer_time = time.time() - start_time
+            logger.info(f"✅ {self.display_name} завершена | Время: {infer_time:.2f} сек" +
+                        (f" | Уверенность: {confidence:.2f}" if confidence else ""))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"   Результат (первые 100 символов): {result[:100]}...")
+
+            return result, confidence
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка инференса {self.display_name}: {str(e)}", exc_info=True)
+            raise
+
+    def infer_batch(self, images: List[Image.Image], prompt: Optional[str] = None, return_confidence: bool = False) -> List[Tuple[str, Optional[float]]]:
+        """
+        Пакетное распознавание: один вызов generate() на все изображения
+
+        Args:
+            images: список PIL Image в формате RGB
+            prompt: инструкция для модели (общая для всего пакета)
+            return_confidence: возвращать ли метрику уверенности
+
+        Returns:
+            Список (распознанный текст, уверенность или None) в порядке images
+        """
+        start_time = time.time()
+        prompt = prompt or self.default_prompt
+
+        try:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"📝 {self.display_name} пакетный инференс | Изображений: {len(images)} | Промпт: {prompt[:50]}...")
+
+            results = self._generate(images, prompt, return_confidence)
+
+            infer_time = time.time() - start_time
+            logger.info(f"✅ {self.display_name} пакет из {len(images)} изображений завершён | Время: {infer_time:.2f} сек")
+
+            return results
+
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетного инференса {self.display_name}: {str(e)}", exc_info=True)
+            raise
+
+    def _generate(self, images: List[Image.Image], prompt: str, return_confidence: bool) -> List[Tuple[str, Optional[float]]]:
+        """
+        Один вызов generate() на пакет изображений с разбором результата по строкам
+
+        Args:
+            images: список PIL Image в формате RGB
+            prompt: инструкция для модели
+            return_confidence: возвращать ли метрику уверенности
+
+        Returns:
+            Список (распознанный текст, уверенность или None) в порядке images
+        """
+        tokenizer = self.processor.tokenizer
+        pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+        # EOS из generation_config (у части моделей их несколько), иначе — из токенизатора
+        eos_token_id = self.model.generation_config.eos_token_id
+        if eos_token_id is None:
+            eos_token_id = tokenizer.eos_token_id
+
+        inputs = self._build_inputs(images, prompt)
+        if self.model.device.type == "cuda":
+            # Из pinned-памяти копирование на GPU асинхронно и не блокирует поток до запуска generate()
+            for key, value in inputs.items():
+                if isinstance(value, torch.Tensor) and value.device.type == "cpu":
+                    inputs[key] = value.pin_memory()
+        inputs = inputs.to(self.model.device, non_blocking=True)
+        inputs.pop("token_type_ids", None)
+        input_length = inputs["input_ids"].shape[1]
+
+        # Токенная уверенность накапливается потоково, без хранения scores всех шагов
+        accumulator = ConfidenceAccumulator(eos_token_id) if return_confidence else None
+        # Экземпляр модели общий для потоков инференса: KV-кэш, CUDA graphs и состояние generate()
+        # не рассчитаны на параллельные вызовы, поэтому generate() одной модели выполняется по очереди
+        with self._generate_lock, torch.inference_mode():
+            sequences = self.model.generate(
+                **inputs,
+                max_new_tokens=self.max_new_tokens,
+                pad_token_id=pad_token_id,
+                eos_token_id=eos_token_id,
+                # Завершённые строки пакета добиваются pad-токенами, generate() останавливается, когда завершены все
+                stopping_criteria=StoppingCriteriaList([StopOnRepetition(input_length)]),
+                logits_processor=LogitsProcessorList([accumulator]) if accumulator else None,
+                do_sample=False,
+                num_beams=1,
+                use_cache=True
+            )
+        token_confidences = accumulator.finalize(sequences) if accumulator else None
+
+        texts = []
+        for i in range(len(images)):
+            # Строки, завершившиеся раньше других, добиты pad-токенами — отрезаем хвост
+            new_tokens = sequences[i, input_length:]
+            pad_positions = (new_tokens == pad_token_id).nonzero()
+            new_length = int(pad_positions[0]) if len(pad_positions) else new_tokens.shape[0]
+            texts.append(self._decode(sequences[i, :input_length + new_length], input_length))
+
+        if not return_confidence:
+            return [(text, None) for text in texts]
+
+        # Эвристика считается по тексту каждой страницы, комбинирование — одним векторным вызовом
+        heuristic_confidences = [
+            confidence_calculator.calculate_heuristic(text, image.size)
+            for text, image in zip(texts, images)
+        ]
+        confidences = confidence_calculator.combine_batch(
+            token_confidences,
+            heuristic_confidences,
+            has_token_scores=True
+        )
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"   Уверенность: токенная={token_confidences}, эвристическая={heuristic_confidences}")
+
+        return [(text, float(confidence)) for text, confidence in zip(texts, confidences)]
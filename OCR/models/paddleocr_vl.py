@@ -10,9 +10,11 @@ from paddlenlp.transformers.image_processing_paddleocr_vl import PaddleOCRVLImag
 import paddle
 from PIL import Image
 import numpy as np
-from utils import logger
+import logging
+from utils import logger, confidence_calculator
+import threading
 import time
-from typing import Tuple, Optional
+from typing import List, Tuple, Optional, Dict
 
 
 class PaddleOCRVLModel:
@@ -29,10 +31,16 @@ class PaddleOCRVLModel:
             self.tokenizer = AutoTokenizer.from_pretrained("PaddlePaddle/PaddleOCR-VL-1.5")
             self.image_processor = PaddleOCRVLImageProcessor.from_pretrained("PaddlePaddle/PaddleOCR-VL-1.5")
 
+            # Токенизированные промпты: промпт обычно один на все страницы документа
+            self._text_inputs_cache: Dict[str, dict] = {}
+            # generate() одного экземпляра модели из нескольких потоков инференса выполняется по очереди
+            self._generate_lock = threading.Lock()
+
             load_time = time.time() - start_time
 
             logger.info(f"✅ PaddleOCR-VL-1.5 загружена за {load_time:.2f} сек")
-            logger.debug(f"   GPU доступен: {paddle.is_compiled_with_cuda()}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"   GPU доступен: {paddle.is_compiled_with_cuda()}")
 
         except Exception as e:
             logger.error(f"❌ Ошибка загрузки PaddleOCR-VL-1.5: {str(e)}", exc_info=True)
@@ -53,37 +61,60 @@ class PaddleOCRVLModel:
         start_time = time.time()
 
         try:
-            logger.debug(f"📝 PaddleOCR-VL-1.5 инференс | Промпт: {prompt[:50]}...")
-            logger.debug(f"   Размер изображения: {image.size} | Формат: {image.mode}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"📝 PaddleOCR-VL-1.5 инференс | Промпт: {prompt[:50]}...")
+                logger.debug(f"   Размер изображения: {image.size} | Формат: {image.mode}")
 
-            # Конвертация PIL → numpy
-            image_np = np.array(image)
+            # Конвертация PIL → numpy (asarray не копирует буфер, полученный от PIL, повторно)
+            image_np = np.asarray(image)
 
             # Предобработка
             inputs = self.image_processor(images=image_np, return_tensors="pd")
-            text_inputs = self.tokenizer(prompt, return_tensors="pd")
+            text_inputs = self._text_inputs_cache.get(prompt)
+            if text_inputs is None:
+                text_inputs = self._text_inputs_cache[prompt] = dict(self.tokenizer(prompt, return_tensors="pd"))
             inputs.update(text_inputs)
 
             # Инференс
-            with paddle.no_grad():
-                output = self.model.generate(**inputs, max_length=1024)
+            with self._generate_lock, paddle.no_grad():
+                output = self.model.generate(
+                    **inputs,
+                    max_length=1024,
+                    eos_token_id=self.tokenizer.eos_token_id,
+                    pad_token_id=self.tokenizer.pad_token_id
+                )
 
             result = self.tokenizer.decode(output[0], skip_special_tokens=True)
 
             # Только эвристическая уверенность (нет доступа к логитам)
             confidence = None
             if return_confidence:
-                from utils import confidence_calculator
                 confidence = confidence_calculator.calculate_heuristic(result, image.size)
-                logger.debug(f"   Эвристическая уверенность: {confidence:.2f}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"   Эвристическая уверенность: {confidence:.2f}")
 
             infer_time = time.time() - start_time
             logger.info(f"✅ PaddleOCR-VL-1.5 завершена | Время: {infer_time:.2f} сек" +
                        (f" | Уверенность: {confidence:.2f}" if confidence else ""))
-            logger.debug(f"   Результат (первые 100 символов): {result[:100]}...")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"   Результат (первые 100 символов): {result[:100]}...")
 
             return result, confidence
 
         except Exception as e:
             logger.error(f"❌ Ошибка инференса PaddleOCR-VL-1.5: {str(e)}", exc_info=True)
-            raise
\ No newline at end of file
+            raise
+
+    def infer_batch(self, images: List[Image.Image], prompt: str = "Extract all text", return_confidence: bool = False) -> List[Tuple[str, Optional[float]]]:
+        """
+        Пакетное распознавание (последовательно: paddlenlp generate не поддерживает пакет с изображениями)
+
+        Args:
+            images: список PIL Image в формате RGB
+            prompt: инструкция для модели
+            return_confidence: возвращать ли метрику уверенности (только эвристическая)
+
+        Returns:
+            Список (распознанный текст, уверенность или None) в порядке images
+        """
+        return [self.infer(image, prompt, return_confidence) for image in images]
\ No newline at end of file
@@ -0,0 +1,48 @@
+# models/quantization.py
+
+"""
+Параметры загрузки весов моделей Transformers: FP16/BF16 или weight-only квантизация через bitsandbytes
+"""
+
+import torch
+from typing import Literal, Dict, Any
+
+QuantMode = Literal["fp16", "bf16", "int8", "nf4"]
+
+QUANT_MODES = ("fp16", "bf16", "int8", "nf4")
+
+
+def quantization_kwargs(quant: QuantMode) -> Dict[str, Any]:
+    """
+    Аргументы from_pretrained для выбранного режима весов.
+
+    INT8 (LLM.int8) ускоряет только матричные умножения на длинных последовательностях
+    (seq_len > 16), а на пошаговом декодировании одного изображения бывает медленнее FP16.
+    Для экономии памяти при инференсе одиночных страниц лучше подходит nf4.
+
+    Args:
+        quant: fp16 | bf16 | int8 | nf4
+
+    Returns:
+        Словарь с torch_dtype или quantization_config
+    """
+    if quant == "fp16":
+        return {"torch_dtype": torch.float16}
+    if quant == "bf16":
+        return {"torch_dtype": torch.bfloat16}
+
+    # bitsandbytes нужен только для квантизованных режимов
+    from transformers import BitsAndBytesConfig
+
+    if quant == "int8":
+        return {"quantization_config": BitsAndBytesConfig(load_in_8bit=True)}
+    if quant == "nf4":
+        return {
+            "quantization_config": BitsAndBytesConfig(
+                load_in_4bit=True,
+                bnb_4bit_quant_type="nf4",
+                bnb_4bit_compute_dtype=torch.bfloat16
+            )
+        }
+
+    raise ValueError(f"Неизвестный режим квантизации: {quant}. Доступные: {', '.join(QUANT_MODES)}")
@@ -0,0 +1,131 @@
+# pdf_worker.py
+
+"""
+Растеризация страниц PDF в процессах пула.
+Модуль намеренно лёгкий (PyMuPDF, PIL, logging): spawn-процессы пула импортируют только его —
+без torch, моделей и файлового логгера сервера. Записи логов воркеров уходят в очередь родителя.
+"""
+
+import logging
+import logging.handlers
+import time
+from typing import Iterator, List, Optional, Tuple, Union
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+# Имя логгера сервера (utils/logger.py); в воркере у него только QueueHandler
+LOGGER_NAME = "ocr_server"
+
+logger = logging.getLogger(LOGGER_NAME)
+
+
+def init_worker(log_queue, level: int) -> None:
+    """
+    Инициализатор процесса пула: логгер пишет только в очередь родителя,
+    файл лога открывает и ротирует один серверный процесс
+
+    Args:
+        log_queue: multiprocessing-очередь, которую читает родитель (None — логи воркера отбрасываются)
+        level: уровень логирования родителя
+    """
+    worker_logger = logging.getLogger(LOGGER_NAME)
+    worker_logger.handlers.clear()
+    worker_logger.setLevel(level)
+    worker_logger.propagate = False
+    if log_queue is None:
+        worker_logger.addHandler(logging.NullHandler())
+    else:
+        worker_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+def render_pages(source: Union[bytes, str], page_range: Optional[range] = None, dpi: int = 300,
+                 max_long_edge: Optional[int] = None) -> List[Tuple[int, Image.Image]]:
+    """
+    Растеризация страниц PDF из байтов или файла по пути
+
+    Args:
+        source: байты PDF или путь к файлу (MuPDF читает файл с диска по мере необходимости)
+        page_range: индексы страниц (с 0) для растеризации, по умолчанию все
+        dpi: разрешение при конвертации
+        max_long_edge: ограничение длинной стороны изображения страницы в пикселях (None — без ограничения)
+
+    Returns:
+        Список кортежей (номер страницы, PIL Image)
+    """
+    try:
+        if isinstance(source, bytes):
+            pdf_document = fitz.open(stream=source, filetype="pdf")
+        else:
+            pdf_document = fitz.open(source, filetype="pdf")
+    except Exception as e:
+        logger.error(f"❌ Ошибка обработки PDF: {str(e)}", exc_info=True)
+        raise ValueError(f"Невозможно обработать PDF файл: {str(e)}")
+
+    start = time.time()
+
+    try:
+        images = list(iter_document_pages(pdf_document, page_range, dpi, max_long_edge))
+
+        elapsed = time.time() - start
+        logger.info(f"✅ PDF обработан за {elapsed:.2f} сек | Страниц обработано: {len(images)}")
+
+        return images
+
+    except Exception as e:
+        logger.error(f"❌ Ошибка обработки PDF: {str(e)}", exc_info=True)
+        raise ValueError(f"Невозможно обработать PDF файл: {str(e)}")
+    finally:
+        pdf_document.close()
+
+
+def iter_document_pages(pdf_document: fitz.Document, page_range: Optional[range] = None, dpi: int = 300,
+                        max_long_edge: Optional[int] = None) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Генератор растеризованных страниц открытого документа (документ не закрывается)
+
+    Args:
+        pdf_document: открытый документ PyMuPDF
+        page_range: индексы страниц (с 0), по умолчанию все
+        dpi: разрешение при конвертации
+        max_long_edge: ограничение длинной стороны изображения страницы в пикселях (None — без ограничения)
+
+    Yields:
+        Кортежи (номер страницы, PIL Image); страницы с ошибкой пропускаются
+    """
+    total_pages = len(pdf_document)
+    if page_range is None:
+        page_range = range(total_pages)
+
+    # dpi -> zoom: 72 DPI = 1.0 zoom, 300 DPI = 300/72 ≈ 4.17
+    zoom = dpi / 72
+    mat = fitz.Matrix(zoom, zoom)
+
+    for page_num in page_range:
+        try:
+            # Получаем страницу и конвертируем её в изображение
+            page = pdf_document[page_num]
+
+            # Масштаб уменьшается сразу при рендеринге, а не последующим ресайзом готового изображения
+            page_mat = mat
+            if max_long_edge:
+                long_edge = max(page.rect.width, page.rect.height) * zoom
+                if long_edge > max_long_edge:
+                    page_zoom = zoom * max_long_edge / long_edge
+                    page_mat = fitz.Matrix(page_zoom, page_zoom)
+
+            # Сразу RGB без альфа-канала — без последующей конвертации цветового пространства
+            pix = page.get_pixmap(matrix=page_mat, alpha=False, colorspace=fitz.csRGB)
+
+            # PIL Image поверх байтов pixmap, без повторного копирования буфера
+            img = Image.frombuffer("RGB", (pix.width, pix.height), pix.samples, "raw", "RGB", pix.stride, 1)
+
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"   ✅ Страница {page_num + 1}/{total_pages} конвертирована | Размер: {img.size}")
+
+        except Exception as e:
+            logger.error(f"   ❌ Ошибка обработки страницы {page_num + 1}: {str(e)}", exc_info=True)
+            # Продолжаем обработку остальных страниц
+            continue
+
+        yield page_num + 1, img
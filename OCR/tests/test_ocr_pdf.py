@@ -0,0 +1,81 @@
+# tests/test_ocr_pdf.py
+"""
+Сквозная проверка /ocr для PDF: растеризация в пуле процессов, пакетный инференс
+(модель подменяется заглушкой, веса не загружаются) и формирование ответа
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+import fitz  # PyMuPDF
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as ocr_app  # noqa: E402
+
+
+class FakeModel:
+    """Заглушка OCR-модели: возвращает размер изображения вместо распознанного текста"""
+
+    def infer(self, image, prompt=None, return_confidence=False):
+        return f"page {image.size}", (0.9 if return_confidence else None)
+
+    def infer_batch(self, images, prompt=None, return_confidence=False):
+        return [self.infer(image, prompt, return_confidence) for image in images]
+
+
+def make_pdf(page_count: int) -> bytes:
+    """PDF с одной строкой текста на каждой странице"""
+    doc = fitz.open()
+    for i in range(page_count):
+        page = doc.new_page(width=200, height=200)
+        page.insert_text((20, 100), f"Page {i + 1}")
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(ocr_app, "get_model", lambda model_name: FakeModel())
+    with TestClient(ocr_app.app) as test_client:
+        yield test_client
+
+
+def test_ocr_pdf_returns_every_page(client):
+    # Больше одного пакета страниц, чтобы проверить сборку результатов конвейера
+    page_count = ocr_app.MAX_OCR_BATCH + 1
+
+    response = client.post(
+        "/ocr",
+        data={"model_name": "glm-ocr", "return_confidence": "true"},
+        files={"image": ("doc.pdf", make_pdf(page_count), "application/pdf")},
+    )
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body["file_type"] == "pdf"
+    assert body["total_pages"] == page_count
+    assert body["processed_pages"] == page_count
+    assert [page["page_number"] for page in body["pages"]] == list(range(1, page_count + 1))
+    assert len(body["confidence_per_page"]) == page_count
+    assert body["confidence"] == pytest.approx(0.9)
+
+
+def test_ocr_pdf_without_pages_is_rejected(client, monkeypatch):
+    # MuPDF не сохраняет документ без страниц, поэтому подменяем подсчёт страниц
+    monkeypatch.setattr(ocr_app.pdf_handler, "count_pages", lambda source: 0)
+
+    response = client.post(
+        "/ocr",
+        data={"model_name": "glm-ocr"},
+        files={"image": ("doc.pdf", make_pdf(1), "application/pdf")},
+    )
+
+    assert response.status_code == 400
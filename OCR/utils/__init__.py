@@ -0,0 +1,18 @@
+# utils/__init__.py
+"""
+Утилиты OCR сервера: логирование, обработка PDF, расчёт уверенности
+"""
+from .logger import logger, setup_logger, get_logger, listen_to_queue
+from .pdf_handler import PDFHandler
+from .confidence import ConfidenceCalculator, ConfidenceAccumulator, confidence_calculator
+
+__all__ = [
+    'logger',
+    'setup_logger',
+    'get_logger',
+    'listen_to_queue',
+    'PDFHandler',
+    'ConfidenceCalculator',
+    'ConfidenceAccumulator',
+    'confidence_calculator'
+]
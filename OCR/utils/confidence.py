@@ -7,9 +7,18 @@
 """
 
 from utils import logger
+from transformers import LogitsProcessor
 import torch
+import numpy as np
+import math
 import re
-from typing import Tuple, Optional, List
+from typing import Tuple, Optional, List, Union
+
+# Символы, не являющиеся буквой/цифрой/пробелом: \w = isalnum() + "_", \s = isspace()
+_JUNK_CHARS_RE = re.compile(r"[^\w\s]|_")
+
+# 5+ повторений одного символа подряд (признак галлюцинаций)
+_REPEAT_RE = re.compile(r"(.)\1{4,}")
 
 
 class ConfidenceCalculator:
@@ -17,6 +26,8 @@ class ConfidenceCalculator:
 
     def __init__(self):
         self.min_token_confidence = 0.01  # Минимальная вероятность токена для учёта
+        self.steps_per_block = 128  # Шагов генерации на один векторизованный softmax
+        self.token_weight = 0.7  # Вес токенной уверенности в итоговой (эвристической — остаток)
 
     def calculate_from_logits(
             self,
@@ -42,33 +53,29 @@ class ConfidenceCalculator:
         try:
             # Извлекаем только сгенерированные токены (без промпта)
             generated_tokens = generated_ids[input_length:]
-            token_confidences = []
-
-            # Для каждого сгенерированного токена получаем вероятность
-            for i, token_id in enumerate(generated_tokens):
-                if i >= len(scores):
-                    break
+            num_steps = min(len(generated_tokens), len(scores))
+            if num_steps == 0:
+                return 0.5, []
 
-                # Получаем логиты для текущего шага
-                logits = scores[i].squeeze(0)  # [vocab_size]
+            token_ids = generated_tokens[:num_steps].long()
 
-                # Применяем softmax для получения вероятностей
-                probs = torch.softmax(logits, dim=-1)
+            # Шаги обрабатываются блоками [block, vocab_size]: один softmax на блок вместо цикла
+            # по токенам, без материализации всех 2048×vocab логитов сразу
+            log_probs = []
+            for block_start in range(0, num_steps, self.steps_per_block):
+                block = scores[block_start:block_start + self.steps_per_block]
+                logits = torch.stack([step.reshape(-1) for step in block]).float()
+                block_ids = token_ids[block_start:block_start + len(block)].to(logits.device)
+                # log p(token) = logit(token) - logsumexp(logits)
+                chosen = logits.gather(-1, block_ids.unsqueeze(-1)).squeeze(-1)
+                log_probs.append(chosen - torch.logsumexp(logits, dim=-1))
 
-                # Получаем вероятность предсказанного токена
-                token_prob = probs[token_id].item()
+            # Ограничиваем минимальную вероятность для стабильности
+            log_probs = torch.cat(log_probs).clamp(min=math.log(self.min_token_confidence))
 
-                # Ограничиваем минимальное значение для стабильности
-                token_prob = max(token_prob, self.min_token_confidence)
-                token_confidences.append(token_prob)
-
-            # Рассчитываем среднюю уверенность (геометрическое среднее для консервативности)
-            if token_confidences:
-                import math
-                avg_confidence = math.exp(sum(math.log(p) for p in token_confidences) / len(token_confidences))
-                return avg_confidence, token_confidences
-            else:
-                return 0.5, []
+            # Средняя уверенность — геометрическое среднее (консервативная оценка)
+            avg_confidence = log_probs.mean().exp().item()
+            return avg_confidence, log_probs.exp().tolist()
 
         except Exception as e:
             logger.warning(f"⚠️  Ошибка расчёта токенной уверенности: {str(e)}")
@@ -99,12 +106,12 @@ class ConfidenceCalculator:
             confidence *= 0.9  # Очень длинный текст — возможны артефакты
 
         # 2. Повторяющиеся символы (признак галлюцинаций)
-        if re.search(r'(.)\1{4,}', text):  # 5+ повторений одного символа
+        if _REPEAT_RE.search(text):  # 5+ повторений одного символа
             confidence *= 0.6
 
         # 3. Соотношение "мусорных" символов
         total_chars = len(text)
-        alphanumeric = sum(c.isalnum() or c.isspace() for c in text)
+        alphanumeric = len(_JUNK_CHARS_RE.sub("", text))  # Удаление за один проход в C вместо цикла по символам
         if total_chars > 0:
             quality_ratio = alphanumeric / total_chars
             confidence *= (0.5 + quality_ratio * 0.5)  # Масштабируем от 0.5 до 1.0
@@ -132,10 +139,111 @@ class ConfidenceCalculator:
         """
         if has_token_scores and token_confidence is not None:
             # Взвешенная комбинация (токенная 70%, эвристическая 30%)
-            return 0.7 * token_confidence + 0.3 * heuristic_confidence
+            return self.token_weight * token_confidence + (1 - self.token_weight) * heuristic_confidence
         else:
             return heuristic_confidence
 
+    def combine_batch(
+            self,
+            token_confidences: Optional[List[Optional[float]]],
+            heuristic_confidences: List[float],
+            has_token_scores: bool
+    ) -> np.ndarray:
+        """
+        Векторный вариант combine_confidences для пакета страниц.
+
+        Args:
+            token_confidences: токенные уверенности по страницам (None — нет данных)
+            heuristic_confidences: эвристические уверенности по страницам
+            has_token_scores: доступны ли токенные оценки для модели
+
+        Returns:
+            Массив итоговых уверенностей по страницам
+        """
+        heuristic = np.asarray(heuristic_confidences, dtype=np.float64)
+        if not has_token_scores or token_confidences is None:
+            return heuristic
+
+        # None → NaN: для таких страниц остаётся только эвристика
+        token = np.asarray(token_confidences, dtype=np.float64)
+        combined = self.token_weight * token + (1 - self.token_weight) * heuristic
+        return np.where(np.isnan(token), heuristic, combined)
+
+
+class ConfidenceAccumulator(LogitsProcessor):
+    """
+    Потоковый расчёт токенной уверенности во время generate().
+
+    Передаётся в generate(logits_processor=LogitsProcessorList([...])) вместо
+    output_scores=True: хранит только лог-вероятности последнего шага [batch, vocab]
+    и накопленные суммы, а не scores всех шагов генерации.
+    """
+
+    def __init__(self, eos_token_id: Optional[Union[int, List[int]]] = None, min_token_confidence: float = 0.01):
+        """
+        Args:
+            eos_token_id: токен(ы) конца генерации; сам EOS учитывается, а всё после него
+                (добивка завершившихся строк пакета) — нет, даже если pad_token_id == eos_token_id
+            min_token_confidence: минимальная вероятность токена для учёта
+        """
+        if eos_token_id is None:
+            self.eos_token_ids = None
+        else:
+            ids = [eos_token_id] if isinstance(eos_token_id, int) else list(eos_token_id)
+            self.eos_token_ids = torch.tensor(ids, dtype=torch.long)
+        self.min_log_prob = math.log(min_token_confidence)
+        self._prev_log_probs: Optional[torch.Tensor] = None
+        self._log_prob_sum: Optional[torch.Tensor] = None
+        self._count: Optional[torch.Tensor] = None
+        self._finished: Optional[torch.Tensor] = None
+
+    def _accumulate(self, token_ids: torch.Tensor) -> None:
+        """Добавляет лог-вероятности выбранных на предыдущем шаге токенов незавершённых строк"""
+        token_ids = token_ids.to(self._prev_log_probs.device)
+        chosen = self._prev_log_probs.gather(-1, token_ids.unsqueeze(-1)).squeeze(-1)
+        chosen = chosen.clamp(min=self.min_log_prob)
+
+        # Строка завершена после первого EOS: дальше идёт только добивка
+        mask = (~self._finished).float()
+        self._log_prob_sum += chosen * mask
+        self._count += mask
+
+        if self.eos_token_ids is not None:
+            self._finished |= torch.isin(token_ids, self.eos_token_ids.to(token_ids.device))
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        # scores — логиты следующего токена; выбранный на прошлом шаге токен уже в input_ids
+        if self._prev_log_probs is None:
+            self._log_prob_sum = torch.zeros(scores.shape[0], device=scores.device)
+            self._count = torch.zeros(scores.shape[0], device=scores.device)
+            self._finished = torch.zeros(scores.shape[0], dtype=torch.bool, device=scores.device)
+        else:
+            self._accumulate(input_ids[:, -1])
+
+        self._prev_log_probs = torch.log_softmax(scores.float(), dim=-1)
+        return scores
+
+    def finalize(self, sequences: torch.Tensor) -> List[float]:
+        """
+        Учитывает последний сгенерированный токен и возвращает уверенность по строкам пакета
+
+        Args:
+            sequences: результат generate() [batch, seq_len]
+
+        Returns:
+            Геометрическое среднее вероятностей токенов для каждой строки (0.5, если токенов нет)
+        """
+        if self._prev_log_probs is None:
+            return [0.5] * sequences.shape[0]
+
+        self._accumulate(sequences[:, -1])
+        self._prev_log_probs = None
+        self._finished = None
+
+        confidences = (self._log_prob_sum / self._count.clamp(min=1)).exp()
+        confidences = torch.where(self._count > 0, confidences, torch.full_like(confidences, 0.5))
+        return confidences.tolist()
+
 
 # Глобальный экземпляр для импорта
 confidence_calculator = ConfidenceCalculator()
\ No newline at end of file
@@ -5,13 +5,36 @@
 Создаёт папку logs/ и ротирует логи (максимум 3 файла по 3 МБ).
 """
 
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 from pathlib import Path
 import sys
 
 
+# Запись в файл и консоль выполняется потоком слушателя очереди,
+# вызывающий код (в том числе поток инференса) только кладёт запись в очередь
+_queue_listeners = {}
+
+
+def _stop_listener(name: str) -> None:
+    """Останавливает слушатель логгера, дописывая оставшиеся в очереди записи"""
+    listener = _queue_listeners.pop(name, None)
+    if listener is not None:
+        listener.stop()
+
+
+def _stop_all_listeners() -> None:
+    """Останавливает все слушатели при завершении процесса"""
+    for name in list(_queue_listeners):
+        _stop_listener(name)
+
+
+atexit.register(_stop_all_listeners)
+
+
 def setup_logger(name: str = "ocr_server", log_dir: str = "logs", level: str = "INFO") -> logging.Logger:
     """
     Настройка логгера с ротацией файлов.
@@ -33,7 +56,8 @@ def setup_logger(name: str = "ocr_server", log_dir: str = "logs", level: str = "
     logger = logging.getLogger(name)
     logger.setLevel(getattr(logging, level.upper()))
 
-    # Очищаем существующие хэндлеры (чтобы избежать дублирования)
+    # Очищаем существующие хэндлеры (чтобы избежать дублирования) и останавливаем прежний слушатель
+    _stop_listener(name)
     if logger.handlers:
         logger.handlers.clear()
 
@@ -79,9 +103,12 @@ def setup_logger(name: str = "ocr_server", log_dir: str = "logs", level: str = "
     )
     console_handler.setFormatter(console_formatter)
 
-    # Добавляем хэндлеры к логгеру
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Хэндлеры работают в потоке слушателя, к логгеру добавляется только QueueHandler
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    _queue_listeners[name] = listener
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
 
     # Логируем информацию о настройке
     logger.info("=" * 70)
@@ -92,6 +119,23 @@ def setup_logger(name: str = "ocr_server", log_dir: str = "logs", level: str = "
     return logger
 
 
+def listen_to_queue(log_queue, name: str = "ocr_server") -> logging.handlers.QueueListener:
+    """
+    Пересылка записей из очереди дочерних процессов в хэндлеры логгера.
+    Файл лога открывает и ротирует только этот процесс.
+
+    Args:
+        log_queue: multiprocessing-очередь, в которую пишут QueueHandler дочерних процессов
+        name: имя логгера
+
+    Returns:
+        Запущенный слушатель (остановить через stop() после завершения дочерних процессов)
+    """
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger(name).handlers)
+    listener.start()
+    return listener
+
+
 def get_logger(name: str = "ocr_server") -> logging.Logger:
     """
     Получение уже настроенного логгера.
@@ -130,5 +174,6 @@ if __name__ == "__main__":
     for i in range(100):
         test_logger.info(f"Тестовое сообщение #{i}")
 
+    _stop_listener("ocr_server")
     print(f"\n✅ Логи сохранены в: {Path('logs').absolute()}")
     print(f"   Файлы: {os.listdir('logs')}")
\ No newline at end of file
@@ -6,95 +6,78 @@
 """
 
 from utils import logger
+from pdf_worker import render_pages
 import fitz  # PyMuPDF
 from PIL import Image
-import io
-from typing import List, Tuple
+from typing import List, Tuple, Optional, Union
 
 
 class PDFHandler:
     """Обработчик многостраничных PDF файлов"""
 
-    def __init__(self, dpi: int = 300):
+    def __init__(self, dpi: int = 300, max_long_edge: Optional[int] = None):
         """
         Инициализация обработчика PDF
 
         Args:
             dpi: разрешение при конвертации (рекомендуется 200-300 для качественного распознавания)
+            max_long_edge: ограничение длинной стороны изображения страницы в пикселях;
+                крупные страницы рендерятся с пониженным масштабом (None — без ограничения)
         """
         self.dpi = dpi
-        logger.debug(f"PDFHandler инициализирован | DPI: {dpi}")
+        self.max_long_edge = max_long_edge
+        logger.debug(f"PDFHandler инициализирован | DPI: {dpi} | Макс. сторона: {max_long_edge or '—'}")
 
-    def pdf_bytes_to_images(self, pdf_bytes: bytes) -> List[Tuple[int, Image.Image]]:
+    def count_pages(self, source: Union[bytes, str]) -> int:
         """
-        Конвертация байтов PDF в список изображений (по одному на страницу)
+        Число страниц PDF без растеризации
 
         Args:
-            pdf_bytes: байты PDF файла
+            source: байты PDF или путь к файлу
 
         Returns:
-            Список кортежей (номер страницы, PIL Image)
+            Количество страниц
         """
-        import time
-        start = time.time()
+        try:
+            if isinstance(source, bytes):
+                pdf_document = fitz.open(stream=source, filetype="pdf")
+            else:
+                pdf_document = fitz.open(source, filetype="pdf")
+        except Exception as e:
+            logger.error(f"❌ Ошибка обработки PDF: {str(e)}", exc_info=True)
+            raise ValueError(f"Невозможно обработать PDF файл: {str(e)}")
 
         try:
-            # Открываем PDF документ
-            pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
             total_pages = len(pdf_document)
-
-            logger.info(f"📄 Обнаружен многостраничный PDF | Страниц: {total_pages}")
-
-            images = []
-
-            for page_num in range(total_pages):
-                try:
-                    # Получаем страницу
-                    page = pdf_document[page_num]
-
-                    # Конвертируем страницу в изображение
-                    # dpi -> zoom: 72 DPI = 1.0 zoom, 300 DPI = 300/72 ≈ 4.17
-                    zoom = self.dpi / 72
-                    mat = fitz.Matrix(zoom, zoom)
-                    pix = page.get_pixmap(matrix=mat)
-
-                    # Конвертируем в PIL Image
-                    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-                    images.append((page_num + 1, img))
-
-                    logger.debug(f"   ✅ Страница {page_num + 1}/{total_pages} конвертирована | Размер: {img.size}")
-
-                except Exception as e:
-                    logger.error(f"   ❌ Ошибка обработки страницы {page_num + 1}: {str(e)}", exc_info=True)
-                    # Продолжаем обработку остальных страниц
-                    continue
-
+        finally:
             pdf_document.close()
 
-            elapsed = time.time() - start
-            logger.info(f"✅ PDF обработан за {elapsed:.2f} сек | Страниц обработано: {len(images)}/{total_pages}")
+        logger.info(f"📄 Обнаружен многостраничный PDF | Страниц: {total_pages}")
+        return total_pages
 
-            return images
+    def pdf_bytes_to_images(self, pdf_bytes: bytes, page_range: Optional[range] = None) -> List[Tuple[int, Image.Image]]:
+        """
+        Конвертация байтов PDF в список изображений (по одному на страницу)
 
-        except Exception as e:
-            logger.error(f"❌ Ошибка обработки PDF: {str(e)}", exc_info=True)
-            raise ValueError(f"Невозможно обработать PDF файл: {str(e)}")
+        Args:
+            pdf_bytes: байты PDF файла
+            page_range: индексы страниц (с 0) для растеризации, по умолчанию все
 
-    def pdf_file_to_images(self, file_path: str) -> List[Tuple[int, Image.Image]]:
+        Returns:
+            Список кортежей (номер страницы, PIL Image)
         """
-        Конвертация PDF файла по пути в список изображений
+        return render_pages(pdf_bytes, page_range, self.dpi, self.max_long_edge)
+
+    def pdf_file_to_images(self, file_path: str, page_range: Optional[range] = None) -> List[Tuple[int, Image.Image]]:
+        """
+        Конвертация PDF файла по пути в список изображений.
+        MuPDF читает файл с диска по мере необходимости, не копируя его целиком в память.
 
         Args:
             file_path: путь к файлу PDF
+            page_range: индексы страниц (с 0) для растеризации, по умолчанию все
 
         Returns:
             Список кортежей (номер страницы, PIL Image)
         """
-        try:
-            with open(file_path, "rb") as f:
-                pdf_bytes = f.read()
-            return self.pdf_bytes_to_images(pdf_bytes)
-        except Exception as e:
-            logger.error(f"❌ Ошибка чтения PDF файла: {str(e)}", exc_info=True)
-            raise
\ No newline at end of file
+        return render_pages(file_path, page_range, self.dpi, self.max_long_edge)
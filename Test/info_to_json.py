@@ -83,6 +83,13 @@ def collect_account_protocol():
     doc_data["valid_until"] = get_non_empty_input("Введите срок действия (например, 18.06.2024): ")
     return doc_data
 
+def save_data():
+    # Запись во временный файл и замена: при сбое во время записи ex.json не повреждается
+    tmp_filename = filename + '.tmp'
+    with open(tmp_filename, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_filename, filename)
+
 def main_loop():
     while True:
         doc_key = get_doc_type()
@@ -106,18 +113,21 @@ def main_loop():
         elif doc_key == "account_protocol":
             doc_data = collect_account_protocol()
 
-        # Сохраняем в JSON
+        # Сохраняем в JSON (в файл — один раз при выходе, а не весь словарь после каждой записи)
         data[doc_key][file_name] = doc_data
 
-        # Сохраняем в файл
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-
-        print(f"Данные для '{file_name}' сохранены в {filename}")
+        print(f"Данные для '{file_name}' добавлены, будут сохранены в {filename} при выходе")
 
         if not ask_yes_no("Хотите внести данные для другого файла? (1 — да, 0 — нет): "):
             break
 
 if __name__ == "__main__":
-    main_loop()
+    try:
+        main_loop()
+    except (KeyboardInterrupt, EOFError):
+        print("\nВвод прерван.")
+    finally:
+        # Сохраняем введённые данные и при обычном выходе, и при Ctrl-C
+        save_data()
+        print(f"Данные сохранены в {filename}")
     print("Программа завершена.")
\ No newline at end of file
@@ -1,3 +1,10 @@
+try:
+    # Расстояние Левенштейна на C++ (бит-параллельный алгоритм Майерса)
+    from rapidfuzz.distance import Levenshtein
+except ImportError:
+    Levenshtein = None
+
+
 def compare_nested_dicts(original_dict: dict, recognized_dict: dict):
     """
     Сравнивает два словаря с вложенными структурами (включая списки словарей)
@@ -7,56 +14,91 @@ def compare_nested_dicts(original_dict: dict, recognized_dict: dict):
         tuple[float, float]: (CER, WER)
     """
 
-    def extract_all_values(d) -> list[str]:
+    def extract_all_values(d) -> str:
         """
-        Рекурсивно извлекает ВСЕ значимые значения (строки, числа) из любой вложенной структуры.
+        Извлекает ВСЕ значимые значения (строки, числа) из любой вложенной структуры
+        за один проход и объединяет их через пробел (для сохранения границ слов).
         Поддерживает: dict, list, str, int, float, None.
         """
-        texts = []
+        parts = []
         stack = [d]
 
         while stack:
             current = stack.pop()
 
             # Строки: добавляем как есть (игнорируем пустые)
-            if isinstance(current, str) and current.strip():
-                texts.append(current.strip())
+            if isinstance(current, str):
+                value = current.strip()
+                if value:
+                    parts.append(value)
 
             # Числа: преобразуем в строку для учёта в метриках
             elif isinstance(current, (int, float)):
-                texts.append(str(current))
+                parts.append(str(current))
 
             # Словари: обрабатываем только значения (ключи игнорируем — они технические)
             elif isinstance(current, dict):
-                for value in current.values():
-                    stack.append(value)
+                stack.extend(current.values())
 
             # Списки: обрабатываем все элементы
             elif isinstance(current, list):
-                for item in current:
-                    stack.append(item)
+                stack.extend(current)
 
             # None и другие типы игнорируем
 
-        return texts
+        return " ".join(parts)
 
     def levenshtein_distance(seq1, seq2):
         """Универсальное расстояние Левенштейна для строк или списков."""
+        if Levenshtein is not None:
+            return Levenshtein.distance(seq1, seq2)
+
+        # Совпадающие начало и конец не влияют на расстояние — отбрасываем их до расчёта
+        # (знаменатель CER/WER считается по исходной длине в compute_cer/compute_wer)
+        prefix = 0
+        max_prefix = min(len(seq1), len(seq2))
+        while prefix < max_prefix and seq1[prefix] == seq2[prefix]:
+            prefix += 1
+        suffix = 0
+        max_suffix = max_prefix - prefix
+        while suffix < max_suffix and seq1[-1 - suffix] == seq2[-1 - suffix]:
+            suffix += 1
+        seq1 = seq1[prefix:len(seq1) - suffix]
+        seq2 = seq2[prefix:len(seq2) - suffix]
+
         if len(seq1) < len(seq2):
-            return levenshtein_distance(seq2, seq1)
-        if not seq1:
-            return len(seq2)
-
-        previous_row = list(range(len(seq2) + 1))
-        for i, c1 in enumerate(seq1, 1):
-            current_row = [i]
-            for j, c2 in enumerate(seq2, 1):
-                insertions = previous_row[j] + 1
-                deletions = current_row[j - 1] + 1
-                substitutions = previous_row[j - 1] + (c1 != c2)
-                current_row.append(min(insertions, deletions, substitutions))
-            previous_row = current_row
-        return previous_row[-1]
+            seq1, seq2 = seq2, seq1
+        if not seq2:
+            return len(seq1)
+
+        # Бит-параллельный алгоритм Майерса: столбец матрицы DP по более короткой
+        # последовательности хранится битами целого числа (int в Python без ограничения разрядности),
+        # поэтому на каждый элемент seq1 приходится несколько битовых операций вместо цикла по seq2
+        pattern_masks = {}
+        for i, item in enumerate(seq2):
+            pattern_masks[item] = pattern_masks.get(item, 0) | (1 << i)
+
+        mask = (1 << len(seq2)) - 1
+        last_bit = 1 << (len(seq2) - 1)
+        vp, vn = mask, 0
+        distance = len(seq2)
+
+        for item in seq1:
+            eq = pattern_masks.get(item, 0)
+            xv = eq | vn
+            xh = (((eq & vp) + vp) ^ vp) | eq
+            hp = vn | ~(xh | vp)
+            hn = vp & xh
+            if hp & last_bit:
+                distance += 1
+            elif hn & last_bit:
+                distance -= 1
+            hp = (hp << 1) | 1
+            hn <<= 1
+            vp = (hn | ~(xv | hp)) & mask
+            vn = hp & xv
+
+        return distance
 
     def compute_cer(ref: str, hyp: str) -> float:
         if not ref:
@@ -69,12 +111,8 @@ def compare_nested_dicts(original_dict: dict, recognized_dict: dict):
         return levenshtein_distance(ref_words, hyp_words) / len(ref_words)
 
     # === Извлечение текста с сохранением ВСЕХ данных ===
-    original_texts = extract_all_values(original_dict)
-    recognized_texts = extract_all_values(recognized_dict)
-
-    # Объединяем с разделителем-пробелом для сохранения границ
-    original_combined = " ".join(original_texts)
-    recognized_combined = " ".join(recognized_texts)
+    original_combined = extract_all_values(original_dict)
+    recognized_combined = extract_all_values(recognized_dict)
 
     # === Расчёт метрик ===
     cer = compute_cer(original_combined, recognized_combined)
@@ -4,6 +4,7 @@ import fitz
 from docx import Document
 from io import BytesIO
 import logging
+import threading
 from config import Config
 from utils import get_file_icon
 
@@ -11,6 +12,43 @@ from utils import get_file_icon
 logger = logging.getLogger(f"app.{__name__}")
 
 
+# Кэш растеризации и разбора документов: перезапуск скрипта Streamlit (например, при смене
+# номера страницы) берёт готовый результат по хэшу байтов файла вместо повторного рендеринга
+@st.cache_resource(max_entries=4, show_spinner=False)
+def _open_pdf(file_bytes: bytes) -> tuple[fitz.Document, threading.Lock]:
+    """
+    Открытый документ PDF, общий для перезапусков скрипта: каталог разбирается один раз на файл,
+    страницы загружаются по требованию. fitz.Document не потокобезопасен, поэтому вместе
+    с ним возвращается блокировка (сессии Streamlit выполняются в разных потоках).
+    Вытесненный из кэша документ закрывается сборщиком мусора.
+    """
+    return fitz.open(stream=file_bytes, filetype="pdf"), threading.Lock()
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _get_pdf_page_count(file_bytes: bytes) -> int:
+    """Количество страниц PDF"""
+    pdf_doc, lock = _open_pdf(file_bytes)
+    with lock:
+        return pdf_doc.page_count
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _render_pdf_page(file_bytes: bytes, page_num: int, dpi: int = Config.DEFAULT_DPI) -> bytes:
+    """Растеризация одной страницы PDF (0-indexed) в PNG"""
+    pdf_doc, lock = _open_pdf(file_bytes)
+    with lock:
+        pix = pdf_doc.load_page(page_num).get_pixmap(dpi=dpi)
+    return pix.tobytes("png")
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _extract_docx_paragraphs(file_bytes: bytes) -> list[str]:
+    """Непустые параграфы DOCX"""
+    doc = Document(BytesIO(file_bytes))
+    return [para.text for para in doc.paragraphs if para.text.strip()]
+
+
 class FilePreviewComponent:
     """
     Компонент для предпросмотра файлов
@@ -62,13 +100,11 @@ class FilePreviewComponent:
     @staticmethod
     def _render_pdf(file_bytes: bytes, file_name: str):
         try:
-            pdf_doc = fitz.open(stream=BytesIO(file_bytes), filetype="pdf")
-            page_count = pdf_doc.page_count
+            page_count = _get_pdf_page_count(file_bytes)
             logger.debug(f"PDF открыт: {page_count} страниц")
 
             if page_count == 0:
                 st.warning("PDF не содержит страниц.")
-                pdf_doc.close()
                 return
 
             # ГЕНЕРАЦИЯ УНИКАЛЬНОГО КЛЮЧА ДЛЯ ВИДЖЕТА
@@ -91,13 +127,9 @@ class FilePreviewComponent:
             )
             page_num = page_num_input - 1
 
-            page = pdf_doc.load_page(page_num)
-            pix = page.get_pixmap(dpi=Config.DEFAULT_DPI)
-            img_data = pix.tobytes("png")
+            img_data = _render_pdf_page(file_bytes, page_num, Config.DEFAULT_DPI)
             st.image(img_data, caption=f"Страница {page_num + 1} из {page_count}", width='stretch')
             logger.debug(f"Отображена страница {page_num + 1} PDF (ключ: {widget_key})")
-
-            pdf_doc.close()
         except Exception as e:
             logger.error(f"Ошибка при открытии PDF '{file_name}': {e}", exc_info=True)
             st.error(f"Ошибка при открытии PDF: {e}")
@@ -105,8 +137,7 @@ class FilePreviewComponent:
     @staticmethod
     def _render_docx(file_bytes: bytes, file_name: str):
         try:
-            doc = Document(BytesIO(file_bytes))
-            paragraphs = [para.text for para in doc.paragraphs if para.text.strip()]
+            paragraphs = _extract_docx_paragraphs(file_bytes)
             logger.debug(f"DOCX загружен: {len(paragraphs)} непустых параграфов")
 
             if not paragraphs:
@@ -197,9 +228,7 @@ class FilePreviewComponent:
         """
         try:
             logger.debug(f"Загрузка PDF для получения количества страниц: {shared_file['name']}")
-            pdf_doc = fitz.open(stream=BytesIO(shared_file["bytes"]), filetype="pdf")
-            page_count = pdf_doc.page_count
-            pdf_doc.close()
+            page_count = _get_pdf_page_count(shared_file["bytes"])
 
             if page_count <= 0:
                 st.warning("📄 PDF не содержит страниц.")
@@ -4,7 +4,6 @@ from services import APIClient
 from components import FilePreviewComponent, SettingsPanel, show_unsupported_file_error, handle_api_error, \
     show_download_button, select_page_number_ui
 from state import SessionManager
-import base64
 from config import Config
 from utils import get_file_icon
 
@@ -58,14 +57,12 @@ def _process_conversion(shared_file: dict, threshold_value: int): # Убрали
             )
             # --- /НЕ ПЕРЕДАЁМ ---
 
-            # Сохранение результатов в сессию (API возвращает список изображений)
-            images_b64_list = result.get("images_base64", [])
-            if not images_b64_list:
+            # Сохранение результатов в сессию (API возвращает список PNG)
+            binary_images = result.get("images", [])
+            if not binary_images:
                 st.error("Пустой результат от сервера.")
                 return
 
-            # Декодируем все строки base64
-            binary_images = [base64.b64decode(b64_str) for b64_str in images_b64_list]
             # Сохраняем список изображений и параметры
             SessionManager.set_binary_results(binary_images, threshold_value, shared_file["name"])
 
@@ -45,10 +45,13 @@ def render_page():
     mime_type = uploaded.type
     file_ext = Path(file_name).suffix.lower()
 
+    # Байты читаются из UploadedFile один раз: и для сессии, и для превью
+    file_bytes = uploaded.getvalue()
+
     try:
         file_info = {
             "name": file_name,
-            "bytes": uploaded.getvalue(),
+            "bytes": file_bytes,
             "type": mime_type,
             "ext": file_ext
         }
@@ -62,7 +65,7 @@ def render_page():
     # Отображаем превью
     try:
         FilePreviewComponent.render(
-            file_bytes=uploaded.getvalue(),
+            file_bytes=file_bytes,
             file_type=mime_type,
             file_name=file_name,
             file_ext=file_ext,
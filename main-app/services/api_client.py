@@ -1,8 +1,112 @@
 # services/api_client.py
+import base64
 import requests
-from typing import Dict, Any
+from services.http_session import http_session
+import uuid
+from typing import Dict, Any, List, Iterator, Tuple
 from utils import APIError
 
+# Размер фрагмента файла в потоковом теле запроса
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# Экранирование имён в Content-Disposition, как в браузерах (RFC 7578, 4.2 / HTML form-data)
+_HEADER_ESCAPES = str.maketrans({'"': "%22", "\r": "%0D", "\n": "%0A"})
+
+
+def _quote_header_value(value: str) -> str:
+    """
+    Экранирует имя поля или файла для заголовка Content-Disposition.
+    Кавычка и переводы строк кодируются процентами, чтобы имя не закрыло строку заголовка;
+    не-ASCII символы передаются как есть в UTF-8 (filename* в multipart/form-data не используется)
+
+    Args:
+        value: имя поля или файла
+
+    Returns:
+        Значение для подстановки в кавычки
+    """
+    return str(value).translate(_HEADER_ESCAPES)
+
+
+def _stream_multipart(filename: str, file_data: bytes, file_type: str,
+                      fields: Dict[str, Any]) -> Tuple[Iterator[bytes], str]:
+    """
+    Потоковое тело multipart/form-data: файл отдаётся срезами memoryview без копирования,
+    в отличие от files= в requests, которое собирает всё тело запроса в памяти
+
+    Args:
+        filename: имя файла
+        file_data: байты файла
+        file_type: MIME-тип файла
+        fields: текстовые поля формы
+
+    Returns:
+        (итератор фрагментов тела, заголовок Content-Type)
+    """
+    boundary = uuid.uuid4().hex
+
+    def iter_body():
+        for name, value in fields.items():
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{_quote_header_value(name)}"\r\n\r\n'
+                   f'{value}\r\n').encode("utf-8")
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+               f'filename="{_quote_header_value(filename)}"\r\n'
+               f'Content-Type: {file_type}\r\n\r\n').encode("utf-8")
+        view = memoryview(file_data)
+        for start in range(0, len(view), UPLOAD_CHUNK_SIZE):
+            yield view[start:start + UPLOAD_CHUNK_SIZE]
+        yield f"\r\n--{boundary}--\r\n".encode("ascii")
+
+    return iter_body(), f"multipart/form-data; boundary={boundary}"
+
+
+def _parse_multipart_images(content: bytes, content_type: str) -> List[bytes]:
+    """
+    Разбор ответа multipart/mixed сервера бинаризации: части с заголовком Content-Length,
+    тело каждой части — сырой PNG
+
+    Args:
+        content: тело ответа
+        content_type: заголовок Content-Type с параметром boundary
+
+    Returns:
+        Список PNG в порядке страниц
+
+    Raises:
+        ValueError: тело не соответствует формату multipart/mixed
+    """
+    if "boundary=" not in content_type:
+        raise ValueError("в Content-Type нет параметра boundary")
+    boundary = content_type.split("boundary=", 1)[1].split(";", 1)[0].strip().strip('"')
+    delimiter = f"--{boundary}".encode("ascii")
+
+    images = []
+    pos = content.find(delimiter)
+    if pos < 0:
+        raise ValueError("в ответе нет разделителя частей multipart")
+    while True:
+        pos += len(delimiter)
+        if content.startswith(b"--", pos):
+            return images  # Закрывающий разделитель
+        headers_end = content.find(b"\r\n\r\n", pos)
+        if headers_end < 0:
+            raise ValueError(f"обрезаны заголовки части {len(images) + 1}")
+        headers = content[pos:headers_end].decode("ascii", errors="replace").split("\r\n")
+        length = next(
+            (line.split(":", 1)[1].strip() for line in headers if line.lower().startswith("content-length:")),
+            None
+        )
+        if length is None or not length.isdigit():
+            raise ValueError(f"у части {len(images) + 1} нет корректного Content-Length")
+        body_start = headers_end + 4
+        body_end = body_start + int(length)
+        if body_end > len(content):
+            raise ValueError(f"тело части {len(images) + 1} обрезано")
+        images.append(content[body_start:body_end])
+        pos = content.find(delimiter, body_end)
+        if pos < 0:
+            raise ValueError("нет закрывающего разделителя multipart")
+
 
 class APIClient:
     """
@@ -14,34 +118,58 @@ class APIClient:
         self.base_url = base_url
 
     def convert_to_binary(self, file_data: bytes, filename: str, threshold: int) -> Dict[str, Any]:
-        """Конвертация файла в бинарное изображение"""
+        """
+        Конвертация файла в бинарное изображение.
+        Страницы запрашиваются сырыми PNG в multipart/mixed — без base64 на сервере и клиенте.
+
+        Returns:
+            {"images": список PNG в порядке страниц, "count": число страниц}
+        """
         try:
-            files = {
-                "file": (filename, file_data, "application/octet-stream"),
-                "threshold": (None, str(threshold)),
-                "output_format": (None, "base64")
-            }
+            body, content_type = _stream_multipart(
+                filename, file_data, "application/octet-stream", {"threshold": threshold}
+            )
 
-            response = requests.post(
+            response = http_session.post(
                 f"{self.base_url}/convert",
-                files=files,
+                data=body,
+                headers={"Content-Type": content_type, "Accept": "multipart/mixed"},
                 timeout=30
             )
             response.raise_for_status()
-            return response.json()
 
         except requests.exceptions.RequestException as e:
             raise APIError(f"Ошибка при конвертации в бинарное изображение: {e}") from e
 
+        try:
+            content_type = response.headers.get("Content-Type", "")
+            if content_type.startswith("multipart/mixed"):
+                images = _parse_multipart_images(response.content, content_type)
+            else:
+                # Сервер без поддержки multipart отвечает JSON с base64
+                images = [base64.b64decode(b64_str) for b64_str in response.json().get("images_base64", [])]
+        except ValueError as e:
+            raise APIError(
+                f"Некорректный ответ сервера конвертации: {e}", status_code=response.status_code
+            ) from e
+
+        expected_count = response.headers.get("X-Image-Count")
+        if expected_count is not None and expected_count.isdigit() and int(expected_count) != len(images):
+            raise APIError(
+                f"Сервер сообщил о {expected_count} страницах, получено {len(images)}",
+                status_code=response.status_code
+            )
+        return {"images": images, "count": len(images)}
+
     def rotate_image(self, image_data: bytes, filename: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """Выравнивание изображения"""
         try:
-            files = {"file": (filename, image_data, "image/png")}
+            body, content_type = _stream_multipart(filename, image_data, "image/png", params)
 
-            response = requests.post(
+            response = http_session.post(
                 f"{self.base_url}/rotate",
-                files=files,
-                data=params,
+                data=body,
+                headers={"Content-Type": content_type},
                 timeout=60
             )
             response.raise_for_status()
@@ -0,0 +1,16 @@
+# services/http_session.py
+"""
+Общая HTTP-сессия клиентов серверов OCR и предобработки.
+Соединения keep-alive переиспользуются между запросами и перезапусками скрипта Streamlit,
+вместо нового TCP-подключения на каждое нажатие кнопки.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Пул соединений на хост: запросы нескольких сессий Streamlit выполняются параллельно
+POOL_MAXSIZE = 4
+
+http_session = requests.Session()
+http_session.mount("http://", HTTPAdapter(pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE))
+http_session.mount("https://", HTTPAdapter(pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE))
@@ -5,6 +5,7 @@
 """
 
 import requests
+from services.http_session import http_session
 from typing import Dict, Any
 from utils.errors import OCRServerError
 
@@ -32,7 +33,7 @@ class OCRClient:
     def health_check(self) -> bool:
         """Проверка доступности сервера"""
         try:
-            response = requests.get(f"{self.base_url}/", timeout=5)
+            response = http_session.get(f"{self.base_url}/", timeout=5)
             return response.status_code == 200
         except requests.exceptions.RequestException:
             return False
@@ -50,7 +51,7 @@ class OCRClient:
             }
         """
         try:
-            response = requests.get(f"{self.base_url}/models", timeout=10)
+            response = http_session.get(f"{self.base_url}/models", timeout=10)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -118,7 +119,7 @@ class OCRClient:
                 "return_confidence": str(return_confidence).lower()
             }
 
-            response = requests.post(
+            response = http_session.post(
                 f"{self.base_url}/ocr",
                 files=files,
                 data=data,
@@ -5,6 +5,7 @@
 """
 
 import requests
+from services.http_session import http_session
 from typing import Dict, Any
 from utils.errors import PreprocessingServerError
 
@@ -31,7 +32,7 @@ class PreprocessingClient:
     def health_check(self) -> bool:
         """Проверка доступности сервера"""
         try:
-            response = requests.get(f"{self.base_url}/health", timeout=5)
+            response = http_session.get(f"{self.base_url}/health", timeout=5)
             return response.status_code == 200
         except requests.exceptions.RequestException:
             return False
@@ -60,7 +61,7 @@ class PreprocessingClient:
             files = {"file": (filename, file_data, "application/octet-stream")}
             data = {"threshold": str(threshold)}
 
-            response = requests.post(
+            response = http_session.post(
                 f"{self.base_url}/convert",
                 files=files,
                 data=data,
@@ -110,7 +111,7 @@ class PreprocessingClient:
         try:
             files = {"file": (filename, image_data, "image/png")}
 
-            response = requests.post(
+            response = http_session.post(
                 f"{self.base_url}/rotate",
                 files=files,
                 data=params,
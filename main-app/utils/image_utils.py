@@ -24,7 +24,7 @@ def convert_file_to_image(file_bytes: bytes, file_type: str, file_ext: str, page
 def _convert_pdf_to_image(pdf_bytes: bytes, page_num: int = 0) -> Optional[bytes]:
     """Конвертация PDF страницы в изображение"""
     try:
-        pdf_doc = fitz.open(stream=BytesIO(pdf_bytes), filetype="pdf")
+        pdf_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
         if page_num >= pdf_doc.page_count:
             page_num = 0
 